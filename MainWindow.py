@@ -15,10 +15,11 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QComboBox, QDoubleSpinBox, QHBoxLayout,
-    QLabel, QLayout, QListView, QMainWindow,
-    QMenuBar, QPushButton, QSizePolicy, QSpinBox,
-    QStatusBar, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox, QDoubleSpinBox,
+    QHBoxLayout, QLabel, QLayout, QListView,
+    QMainWindow, QMenuBar, QPushButton, QSizePolicy,
+    QSpacerItem, QSpinBox, QStatusBar, QVBoxLayout,
+    QWidget)
 
 from pyqtgraph import PlotWidget
 
@@ -119,6 +120,21 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout.addWidget(self.PointsNmspinBox)
 
+        self.autoPointsCheckBox = QCheckBox(self.centralwidget)
+        self.autoPointsCheckBox.setObjectName(u"autoPointsCheckBox")
+
+        self.horizontalLayout.addWidget(self.autoPointsCheckBox)
+
+        self.instrumentLabel = QLabel(self.centralwidget)
+        self.instrumentLabel.setObjectName(u"instrumentLabel")
+
+        self.horizontalLayout.addWidget(self.instrumentLabel)
+
+        self.instrumentComboBox = QComboBox(self.centralwidget)
+        self.instrumentComboBox.setObjectName(u"instrumentComboBox")
+
+        self.horizontalLayout.addWidget(self.instrumentComboBox)
+
         self.SweepPushButton = QPushButton(self.centralwidget)
         self.SweepPushButton.setObjectName(u"SweepPushButton")
         icon = QIcon()
@@ -128,11 +144,56 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout.addWidget(self.SweepPushButton)
 
+        self.SweepAllPushButton = QPushButton(self.centralwidget)
+        self.SweepAllPushButton.setObjectName(u"SweepAllPushButton")
+        self.SweepAllPushButton.setIconSize(QSize(32, 32))
+
+        self.horizontalLayout.addWidget(self.SweepAllPushButton)
+
+        self.StopPushButton = QPushButton(self.centralwidget)
+        self.StopPushButton.setObjectName(u"StopPushButton")
+        self.StopPushButton.setEnabled(False)
+        self.StopPushButton.setIconSize(QSize(32, 32))
+
+        self.horizontalLayout.addWidget(self.StopPushButton)
+
 
         self.verticalLayout_2.addLayout(self.horizontalLayout)
 
         self.horizontalLayout_2 = QHBoxLayout()
         self.horizontalLayout_2.setObjectName(u"horizontalLayout_2")
+        self.waterfallCheckBox = QCheckBox(self.centralwidget)
+        self.waterfallCheckBox.setObjectName(u"waterfallCheckBox")
+
+        self.horizontalLayout_2.addWidget(self.waterfallCheckBox)
+
+        self.continuousCheckBox = QCheckBox(self.centralwidget)
+        self.continuousCheckBox.setObjectName(u"continuousCheckBox")
+
+        self.horizontalLayout_2.addWidget(self.continuousCheckBox)
+
+        self.displayModeLabel = QLabel(self.centralwidget)
+        self.displayModeLabel.setObjectName(u"displayModeLabel")
+
+        self.horizontalLayout_2.addWidget(self.displayModeLabel)
+
+        self.displayModeComboBox = QComboBox(self.centralwidget)
+        self.displayModeComboBox.addItem("")
+        self.displayModeComboBox.addItem("")
+        self.displayModeComboBox.addItem("")
+        self.displayModeComboBox.setObjectName(u"displayModeComboBox")
+
+        self.horizontalLayout_2.addWidget(self.displayModeComboBox)
+
+        self.horizontalSpacer = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
+
+        self.horizontalLayout_2.addItem(self.horizontalSpacer)
+
+        self.predictionLabel = QLabel(self.centralwidget)
+        self.predictionLabel.setObjectName(u"predictionLabel")
+
+        self.horizontalLayout_2.addWidget(self.predictionLabel)
+
 
         self.verticalLayout_2.addLayout(self.horizontalLayout_2)
 
@@ -148,6 +209,14 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_4.addWidget(self.plotWidget)
 
+        self.waterfallWidget = PlotWidget(self.centralwidget)
+        self.waterfallWidget.setObjectName(u"waterfallWidget")
+        self.waterfallWidget.setVisible(False)
+        sizePolicy.setHeightForWidth(self.waterfallWidget.sizePolicy().hasHeightForWidth())
+        self.waterfallWidget.setSizePolicy(sizePolicy)
+
+        self.horizontalLayout_4.addWidget(self.waterfallWidget)
+
         self.horizontalLayout_3 = QHBoxLayout()
         self.horizontalLayout_3.setObjectName(u"horizontalLayout_3")
         self.verticalLayout = QVBoxLayout()
@@ -203,7 +272,8 @@ class Ui_MainWindow(object):
         self.horizontalLayout_4.addLayout(self.horizontalLayout_3)
 
         self.horizontalLayout_4.setStretch(0, 4)
-        self.horizontalLayout_4.setStretch(1, 1)
+        self.horizontalLayout_4.setStretch(1, 3)
+        self.horizontalLayout_4.setStretch(2, 1)
 
         self.verticalLayout_2.addLayout(self.horizontalLayout_4)
 
@@ -235,7 +305,25 @@ class Ui_MainWindow(object):
         self.referenceLevelLabel.setText(QCoreApplication.translate("MainWindow", u"Reference Level (dBm)", None))
         self.resoltuionNmLabel.setText(QCoreApplication.translate("MainWindow", u"Resoltuion (nm)", None))
         self.PointsNmlabel.setText(QCoreApplication.translate("MainWindow", u"Points/nm", None))
+#if QT_CONFIG(tooltip)
+        self.autoPointsCheckBox.setToolTip(QCoreApplication.translate("MainWindow", u"Choose the points from the resolution", None))
+#endif // QT_CONFIG(tooltip)
+        self.autoPointsCheckBox.setText(QCoreApplication.translate("MainWindow", u"Auto", None))
+        self.instrumentLabel.setText(QCoreApplication.translate("MainWindow", u"OSA", None))
         self.SweepPushButton.setText(QCoreApplication.translate("MainWindow", u"Sweep", None))
+#if QT_CONFIG(tooltip)
+        self.SweepAllPushButton.setToolTip(QCoreApplication.translate("MainWindow", u"Sweep with all the OSAs at the same time", None))
+#endif // QT_CONFIG(tooltip)
+        self.SweepAllPushButton.setText(QCoreApplication.translate("MainWindow", u"Sweep all", None))
+        self.StopPushButton.setText(QCoreApplication.translate("MainWindow", u"Stop", None))
+        self.waterfallCheckBox.setText(QCoreApplication.translate("MainWindow", u"Waterfall", None))
+        self.continuousCheckBox.setText(QCoreApplication.translate("MainWindow", u"Continuous sweep", None))
+        self.displayModeLabel.setText(QCoreApplication.translate("MainWindow", u"Display", None))
+        self.displayModeComboBox.setItemText(0, QCoreApplication.translate("MainWindow", u"Absolute (dBm)", None))
+        self.displayModeComboBox.setItemText(1, QCoreApplication.translate("MainWindow", u"Difference (dB)", None))
+        self.displayModeComboBox.setItemText(2, QCoreApplication.translate("MainWindow", u"Ratio (linear)", None))
+
+        self.predictionLabel.setText("")
         self.label.setText(QCoreApplication.translate("MainWindow", u"Visible", None))
         self.DeletePushButton.setText(QCoreApplication.translate("MainWindow", u"Delete", None))
         self.SavePushButton.setText(QCoreApplication.translate("MainWindow", u"Save checked", None))
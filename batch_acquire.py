@@ -0,0 +1,237 @@
+"""
+Headless batch acquisition with the OSA, runs a sweep plan (JSON, see README.md) without the GUI.
+
+    python batch_acquire.py plan.json --output ./campaign --format campaign --cycles 0
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+
+import osa_driver
+import segmented_sweep
+from spectrum_io import to_dataarray, timestamp
+from sweep_scheduler import changed_params, order_configurations
+import sampling
+
+#Seconds to wait before retrying a sweep that failed with an I/O error (e.g. a GPIB timeout)
+retry_delay = 30
+max_retries = 3
+
+sensitivities = ('SNHD', 'SNAT', 'SHI1', 'SHI2', 'SHI3')
+span_keys = ('start', 'stop', 'trace_points')
+
+
+def check_params(name, params):
+    """Checks the sweep parameters of a configuration with the limits of osa_driver, before the campaign starts"""
+    known = ('start', 'stop', 'resolution', 'ref_level', 'sensitivity', 'trace', 'trace_points')
+    unknown = set(params) - set(known)
+    assert not unknown, f'Configuration {name} has unknown parameters {sorted(unknown)}'
+    for key in ('start', 'stop'):
+        if key in params:
+            assert 600 <= params[key] <= 1750, f'Configuration {name}: {key} must be between 600 and 1750 nm'
+    if 'start' in params and 'stop' in params:
+        assert params['start'] < params['stop'], f'Configuration {name}: start must be below stop'
+    if 'resolution' in params:
+        assert 0.01 <= params['resolution'] <= 2.0, f'Configuration {name}: resolution must be between 0.01 and 2 nm'
+    if 'ref_level' in params:
+        assert -90 <= params['ref_level'] <= 20, f'Configuration {name}: ref_level must be between -90 and 20 dBm'
+    if 'sensitivity' in params:
+        assert params['sensitivity'] in sensitivities, f'Configuration {name}: sensitivity must be one of {sensitivities}'
+    if 'trace' in params:
+        assert params['trace'] in ('A', 'B', 'C'), f'Configuration {name}: trace must be A, B or C'
+    if 'trace_points' in params:
+        assert isinstance(params['trace_points'], int) and params['trace_points'] >= sampling.min_trace_points, \
+            f'Configuration {name}: trace_points must be an integer of at least {sampling.min_trace_points}'
+        if params['trace_points'] > segmented_sweep.max_trace_points:
+            #Swept in segments, which need the whole span
+            assert 'start' in params and 'stop' in params, f'Configuration {name}: segmented sweeps need start and stop'
+
+
+def load_plan(path):
+    """Reads and validates the sweep plan"""
+    with open(path) as f:
+        plan = json.load(f)
+    assert 'configurations' in plan and len(plan['configurations']) > 0, 'The plan has no configurations'
+    for i, config in enumerate(plan['configurations']):
+        config.setdefault('name', f'config{i}')
+        config.setdefault('params', {})
+        config.setdefault('repeats', 1)
+        config.setdefault('interval', 0)
+        assert config['repeats'] >= 1, f'Configuration {config["name"]} needs at least one repeat'
+        assert config['interval'] >= 0, f'Configuration {config["name"]} has a negative interval'
+        params = config['params']
+        if params.get('trace_points') == 'auto':
+            assert all(key in params for key in ('start', 'stop', 'resolution')), \
+                f'Configuration {config["name"]}: auto trace_points needs start, stop and resolution'
+            params['trace_points'] = sampling.auto_trace_points(params['start'], params['stop'], params['resolution'])
+        check_params(config['name'], params)
+    plan.setdefault('output', '.')
+    plan.setdefault('format', 'netcdf')
+    plan.setdefault('cycles', 1)
+    plan.setdefault('schedule', False)
+    assert plan['format'] in ('netcdf', 'campaign'), f'Unknown format {plan["format"]}'
+    return plan
+
+
+class CampaignWriter:
+    """Saves every sweep to disk as soon as it is acquired"""
+
+    def __init__(self, output, file_format):
+        self.output = output
+        self.file_format = file_format
+        os.makedirs(output, exist_ok=True)
+        self.index_path = os.path.join(output, 'index.csv')
+        if file_format == 'campaign' and not os.path.exists(self.index_path):
+            with open(self.index_path, 'w', newline='') as f:
+                csv.writer(f).writerow(['date', 'configuration', 'repeat', 'file', 'points', 'sweep_time_s'])
+
+    def write(self, spectrum, config, repeat, sweep_time):
+        name = f'{config["name"]} {repeat}'
+        power_array = to_dataarray(spectrum, name, attrs=config['params'])
+        power_array.attrs['date'] = timestamp()
+        power_array.attrs['sweep_time_s'] = sweep_time
+        if self.file_format == 'campaign':
+            folder = os.path.join(self.output, config['name'])
+            os.makedirs(folder, exist_ok=True)
+        else:
+            folder = self.output
+        path = os.path.join(folder, f'{timestamp()} {name}.nc')
+        power_array.to_netcdf(path)
+        if self.file_format == 'campaign':
+            with open(self.index_path, 'a', newline='') as f:
+                csv.writer(f).writerow([power_array.attrs['date'], config['name'], repeat,
+                                        os.path.relpath(path, self.output), power_array.size, f'{sweep_time:.2f}'])
+        return path
+
+
+def retryable_errors():
+    """I/O errors and timeouts of the GPIB bus or the server connection, the ones that trying again can fix"""
+    errors = (OSError, TimeoutError)
+    try:
+        import pyvisa
+    except ImportError:
+        return errors
+    return errors + (pyvisa.errors.VisaIOError,)
+
+
+def local_trace(updated_params, params):
+    """Sweeps with the OSA of osa_driver. Spans with more points than it takes in a sweep are swept in segments"""
+    if params.get('trace_points', 0) > segmented_sweep.max_trace_points:
+        return segmented_sweep.get_segmented_trace(params, updated_params)
+    return osa_driver.get_trace(updated_params)
+
+
+def acquire(params, sent_params, get_trace=None, send_changes=True):
+    """Sweeps with params, sending to the OSA only what changed since the last sweep (all of them if not send_changes).
+    get_trace takes the parameters to send, None sweeps with the OSA of osa_driver (local_trace).
+    Retries after a delay if the sweep fails with an I/O error, so that a glitch does not stop a long campaign"""
+    for attempt in range(max_retries + 1):
+        updated_params = changed_params(sent_params, params) if attempt == 0 and send_changes else dict(params)
+        try:
+            if get_trace is None:
+                spectrum = local_trace(updated_params, params)
+            else:
+                spectrum = get_trace(updated_params)
+        except retryable_errors():
+            if attempt == max_retries:
+                raise
+            traceback.print_exc()
+            print(f'Sweep failed, retrying in {retry_delay} s ({attempt + 1}/{max_retries})')
+            time.sleep(retry_delay)
+        else:
+            return spectrum
+
+
+def run_plan(plan, get_trace=None, send_changes=True):
+    """Runs the plan and returns the statistics of the run.
+    get_trace is None for the OSA of osa_driver, or the one of an osa_client.OSAClient to use a shared OSA.
+    With a shared OSA send_changes must be False: other clients may change the settings between two
+    sweeps, so every sweep sends all its parameters and the server sends the OSA what differs"""
+    writer = CampaignWriter(plan['output'], plan['format'])
+    stats = {'sweeps': 0, 'failed': 0, 'points': 0, 'sweep_time': 0.0}
+    sent_params = {}
+    start_time = time.monotonic()
+    cycle = 0
+    try:
+        while plan['cycles'] == 0 or cycle < plan['cycles']:
+            configurations = plan['configurations']
+            if plan['schedule']:
+                order = order_configurations([config['params'] for config in configurations],
+                                             osa_driver.setting_latency, initial=sent_params)
+                configurations = [configurations[i] for i in order]
+                print('Scheduled order: ' + ', '.join(config['name'] for config in configurations))
+            for config in configurations:
+                next_start = time.monotonic()
+                for repeat in range(config['repeats']):
+                    #Wait for the interval, scheduled from the start of the previous repeat so it does not drift
+                    wait = next_start - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    next_start = time.monotonic() + config['interval']
+                    sweep_start = time.monotonic()
+                    try:
+                        spectrum = acquire(config['params'], sent_params, get_trace, send_changes)
+                    except Exception:
+                        traceback.print_exc()
+                        stats['failed'] += 1
+                        sent_params = {} #Unknown state of the OSA, send everything next time
+                        continue
+                    sweep_time = time.monotonic() - sweep_start
+                    sent_params = dict(config['params'])
+                    if sent_params.get('trace_points', 0) > segmented_sweep.max_trace_points:
+                        #The OSA is left with the span of the last segment, send it again next time
+                        sent_params = {k: v for k, v in sent_params.items() if k not in span_keys}
+                    path = writer.write(spectrum, config, cycle * config['repeats'] + repeat, sweep_time)
+                    stats['sweeps'] += 1
+                    stats['points'] += len(spectrum['power'].magnitude)
+                    stats['sweep_time'] += sweep_time
+                    print(f'{timestamp()} {config["name"]} {repeat + 1}/{config["repeats"]} saved to {path}')
+            cycle += 1
+    except KeyboardInterrupt:
+        print('Interrupted by the user')
+    stats['elapsed'] = time.monotonic() - start_time
+    return stats
+
+
+def print_throughput(stats):
+    elapsed = stats['elapsed']
+    print('')
+    print(f'Sweeps: {stats["sweeps"]} ({stats["failed"]} failed)')
+    print(f'Points: {stats["points"]}')
+    print(f'Elapsed time: {elapsed:.1f} s, of which sweeping and transferring: {stats["sweep_time"]:.1f} s')
+    if elapsed > 0:
+        print(f'Throughput: {stats["sweeps"] / elapsed * 3600:.1f} sweeps/h, {stats["points"] / elapsed:.1f} points/s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Unattended sweep acquisition with the OSA')
+    parser.add_argument('plan', help='JSON file with the sweep plan')
+    parser.add_argument('--output', help='Output folder, overrides the one in the plan')
+    parser.add_argument('--format', choices=['netcdf', 'campaign'], help='Output format, overrides the one in the plan')
+    parser.add_argument('--cycles', type=int, help='Times the plan is run, 0 runs until interrupted')
+    parser.add_argument('--schedule', action='store_true', default=None,
+                        help='Reorder the configurations to minimize the reconfiguration time')
+    parser.add_argument('--server', help="Use the OSA through osa_server.py at this address ('host:port' or 'unix:/path')")
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.plan)
+    for key in ('output', 'format', 'cycles', 'schedule'):
+        if getattr(args, key) is not None:
+            plan[key] = getattr(args, key)
+
+    if args.server:
+        from osa_client import OSAClient
+        stats = run_plan(plan, OSAClient(args.server).get_trace, send_changes=False)
+    else:
+        stats = run_plan(plan)
+    print_throughput(stats)
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
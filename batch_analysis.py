@@ -0,0 +1,211 @@
+"""
+Batch analysis of saved spectra in a pool of processes, the results go to a CSV table.
+
+    python batch_analysis.py ./campaign "./temp/*.nc" --band 1520 1550 --output results.csv
+"""
+
+import argparse
+import csv
+import functools
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+#Files sent to a worker at a time, the results are written after each chunk
+max_chunk_files = 32
+
+
+def find_files(patterns):
+    """.nc files in the directories (recursively) and glob patterns"""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.update(glob.glob(os.path.join(pattern, '**', '*.nc'), recursive=True))
+        else:
+            files.update(glob.glob(pattern, recursive=True))
+    return sorted(os.path.abspath(path) for path in files)
+
+
+def resolution_of(power_array):
+    """Resolution in nm from the attributes, NaN if it is not there (or was saved as text)"""
+    try:
+        return float(power_array.attrs.get('resolution', np.nan))
+    except ValueError:
+        return np.nan
+
+
+def spectral_metrics(power_array, band=None):
+    """Band power, peak and resolution-normalized densities of a trace in dBm over nm.
+    band is (start, stop) in nm, the whole trace by default"""
+    if power_array.attrs.get('units', 'dBm') != 'dBm':
+        return {} #Normalized traces (dB or ratio) have no absolute power
+    if band is not None:
+        power_array = power_array.sel(Wavelength=slice(*band))
+    wavelength = power_array['Wavelength'].values
+    power = power_array.values #Only the band is read from the file
+    valid = ~np.isnan(power)
+    wavelength, power = wavelength[valid], power[valid]
+    if len(power) == 0:
+        return {}
+    resolution = resolution_of(power_array)
+    step = (wavelength[-1] - wavelength[0]) / (len(wavelength) - 1) if len(wavelength) > 1 else resolution
+    #Each point is the power in one resolution bandwidth, the band power sums the density over the band
+    band_power = 10 * np.log10(np.sum(10**(power / 10)) * step / resolution)
+    peak = np.argmax(power)
+    width = wavelength[-1] - wavelength[0]
+    return {
+        'band_start_nm': wavelength[0],
+        'band_stop_nm': wavelength[-1],
+        'resolution_nm': resolution,
+        'band_power_dBm': band_power,
+        'peak_wavelength_nm': wavelength[peak],
+        'peak_power_dBm': power[peak],
+        'peak_density_dBm/nm': power[peak] - 10 * np.log10(resolution),
+        'mean_density_dBm/nm': band_power - 10 * np.log10(width) if width > 0 else np.nan,
+    }
+
+
+def analyze_file(path, analysis):
+    """Rows (file, trace, metric, value) of every trace in the file"""
+    import xarray as xr
+    rows = []
+    with xr.open_dataset(path) as dataset:
+        for name, power_array in dataset.data_vars.items():
+            if power_array.dims != ('Wavelength',):
+                continue
+            #Files saved before the configuration was stored per trace have it in the file attributes
+            power_array.attrs = {**dataset.attrs, **power_array.attrs}
+            for metric, value in analysis(power_array).items():
+                rows.append((path, name, metric, value))
+    return rows
+
+
+def analyze_files(paths, analysis):
+    """Runs in a worker. Returns a list of (path, rows, error) with the error message if it failed"""
+    results = []
+    for path in paths:
+        try:
+            results.append((path, analyze_file(path, analysis), None))
+        except Exception as e:
+            results.append((path, [], f'{type(e).__name__}: {e}'))
+    return results
+
+
+def done_files(output):
+    """Files that were already analyzed into the output table, with or without results.
+    They are listed in output.done; tables written before it existed have their files in the rows"""
+    if not os.path.exists(output):
+        return set()
+    if os.path.exists(output + '.done'):
+        with open(output + '.done') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    with open(output, newline='') as f:
+        return {row['file'] for row in csv.DictReader(f)}
+
+
+def check_settings(output, settings):
+    """Stores the analysis settings of a new table in output.settings, and checks that an existing
+    table was made with the same ones. Raises ValueError if they differ"""
+    path = output + '.settings'
+    if os.path.exists(output) and os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored != settings:
+            raise ValueError(f'{output} was made with {stored}, not {settings}. Use another output')
+        return
+    if os.path.exists(output):
+        print(f'Warning: {output} has no stored settings, assuming {settings}')
+    with open(path, 'w') as f:
+        json.dump(settings, f)
+
+
+def load_analysis(spec):
+    """Function from 'module:function'"""
+    module_name, function_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run(files, output, analysis, workers=None, settings=None):
+    """Analyzes the files that are not in output yet and appends their results. Returns the statistics of the run.
+    settings describe the analysis (a JSON serializable dictionary), a table is only resumed with the same ones"""
+    if settings is not None:
+        check_settings(output, settings)
+    done = done_files(output)
+    pending = [path for path in files if path not in done]
+    workers = workers or os.cpu_count()
+    stats = {'files': 0, 'skipped': len(files) - len(pending), 'failed': 0, 'rows': 0}
+    chunk_size = max(1, min(max_chunk_files, len(pending) // (workers * 4)))
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    start_time = time.monotonic()
+
+    new_file = not os.path.exists(output)
+    if new_file or not os.path.exists(output + '.done'):
+        with open(output + '.done', 'w') as done_file:
+            done_file.writelines(path + '\n' for path in done)
+    with open(output, 'a', newline='') as f, open(output + '.done', 'a') as done_file:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['file', 'trace', 'metric', 'value'])
+
+        def write(results):
+            for path, rows, error in results:
+                if error:
+                    stats['failed'] += 1
+                    print(f'{path}: {error}')
+                    continue
+                writer.writerows(rows)
+                stats['files'] += 1
+                stats['rows'] += len(rows)
+            f.flush()
+            #A file is done once its rows are in the table, even if it had none
+            done_file.writelines(path + '\n' for path, _, error in results if not error)
+            done_file.flush()
+            print(f'{stats["files"] + stats["failed"]}/{len(pending)} files')
+
+        if workers == 1:
+            #In this process, easier to debug
+            for chunk in chunks:
+                write(analyze_files(chunk, analysis))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(analyze_files, chunk, analysis) for chunk in chunks]
+                for future in as_completed(futures):
+                    write(future.result())
+    stats['elapsed'] = time.monotonic() - start_time
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analysis of saved spectra in parallel')
+    parser.add_argument('inputs', nargs='+', help='Directories or glob patterns of .nc files')
+    parser.add_argument('--output', default='results.csv', help='CSV table of results, appended to if it exists')
+    parser.add_argument('--band', type=float, nargs=2, metavar=('START', 'STOP'), help='Band in nm for the default analysis')
+    parser.add_argument('--analysis', help='Analysis function as module:function, instead of the default one')
+    parser.add_argument('--workers', type=int, help='Worker processes, the number of cores by default')
+    args = parser.parse_args(argv)
+
+    if args.analysis:
+        analysis = load_analysis(args.analysis)
+        settings = {'analysis': args.analysis}
+    else:
+        analysis = functools.partial(spectral_metrics, band=args.band)
+        settings = {'analysis': 'spectral_metrics', 'band': args.band}
+    files = find_files(args.inputs)
+    try:
+        stats = run(files, args.output, analysis, args.workers, settings)
+    except ValueError as error:
+        print(error)
+        return 2
+    print(f'Files: {stats["files"]} analyzed, {stats["skipped"]} already done, {stats["failed"]} failed')
+    print(f'Rows: {stats["rows"]}, elapsed time: {stats["elapsed"]:.1f} s')
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Startup time benchmark of the GUI, fails if it goes over the limit or a deferred module is imported.
+
+    python bench_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+#Default maximum median time in s, well above the ~0.8 s measured so that a loaded machine does not fail it
+default_limit = 3.0
+#Modules that must not be imported before the window is shown
+deferred_modules = ('xarray', 'pandas', 'pint', 'pyvisa', 'csv')
+
+#Runs in the child interpreter, prints the time until the window was shown and the modules loaded by then
+child_code = '''
+import time
+start = time.perf_counter()
+import json, sys
+from PySide6 import QtWidgets
+import main
+app = QtWidgets.QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+elapsed = time.perf_counter() - start
+loaded = sorted(name for name in %r if name in sys.modules)
+print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))
+'''
+
+
+def measure():
+    """Time in s from the first import to the window shown, and the deferred modules loaded by then.
+    Measured in the child, so the interpreter startup and teardown are not counted"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', OSA_SIMULATE='1')
+    result = subprocess.run([sys.executable, '-c', child_code % (deferred_modules,)], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    return measurement['elapsed'], measurement['loaded']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the time until the main window is shown')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--limit', type=float, default=default_limit, help='Maximum median startup time in s')
+    args = parser.parse_args(argv)
+
+    times = []
+    loaded = []
+    for _ in range(args.runs):
+        elapsed, loaded = measure()
+        times.append(elapsed)
+    median = statistics.median(times)
+    print(f'Startup time: median {median:.2f} s, min {min(times):.2f} s, max {max(times):.2f} s ({args.runs} runs)')
+
+    failed = False
+    if loaded:
+        print(f'Imported before the window was shown: {", ".join(loaded)}')
+        failed = True
+    if median > args.limit:
+        print(f'Startup time over the limit of {args.limit:.2f} s')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,48 @@
-import sys, traceback, csv
+import sys, traceback, importlib, threading
 from PySide6 import QtWidgets, QtGui
-from PySide6.QtCore import QTimer, QRunnable, Slot, Signal, QObject, QThreadPool, QModelIndex, QAbstractListModel,Qt
+from PySide6.QtCore import QRectF, QTimer, QRunnable, Slot, Signal, QObject, QThreadPool, QModelIndex, QAbstractListModel,Qt
 from pyqtgraph import PlotWidget
 import pyqtgraph as pg
 import numpy as np
 import time, datetime
-import xarray as xr
-from pint import UnitRegistry
+from collections import deque
+#xarray, csv and pint are imported on first use (pint through units), so that the window shows sooner
 
 
 
 from MainWindow import Ui_MainWindow
-
-ureg = UnitRegistry(autoconvert_offset_to_baseunit=True)
-Q_ = ureg.Quantity
+from spectrum_io import to_dataarray, to_common_axis, timestamp
+from waterfall import WaterfallBuffer
+from reference import ReferenceNormalizer, modes, mode_units
+from trace_store import TraceStore
+from resample import Resampler
+import sampling
+from units import ureg, Q_, get_registry
 
 offline_mode = False
 save_every_sweep = False
-
-if not offline_mode: import osa_driver
+waterfall_capacity = 500 #Sweeps kept in the waterfall view
+keep_partial_sweeps = False #Add to the list the part of an aborted sweep that was acquired
+memory_budget = 1024 #MB of traces kept in memory, beyond it the least recently viewed hidden traces go to disk
+server_address = None #e.g. 'localhost:5025' to use the OSA through osa_server.py, shared with other programs
+instrument_addresses = [] #GPIB addresses of more OSAs besides osa_driver.resource_name, e.g. ['GPIB0::1::INSTR']
+
+if offline_mode:
+    pass
+elif server_address:
+    import osa_client
+else:
+    import osa_driver
+    import segmented_sweep
 
 #Matplotlib default set of colors
 colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2',
  '#7f7f7f', '#bcbd22', '#17becf']
 
+def trace_nbytes(power_array):
+    """Memory used by a trace: its DataArray and the copy of the arrays in its plot item"""
+    return 2 * (power_array.nbytes + power_array['Wavelength'].nbytes)
+
 class WorkerSignals(QObject):
     '''
     Defines the signals available from a running worker thread.
@@ -110,6 +129,16 @@ class SpectraViewList(QAbstractListModel):
         if role == Qt.ItemDataRole.DecorationRole:
             color = self.spectraList[index.row()]['color']
             return color
+
+        #The OSA that acquired the trace
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.spectraList[index.row()].get('instrument')
+
+        #The reference trace is shown in bold
+        if role == Qt.ItemDataRole.FontRole and self.spectraList[index.row()].get('reference'):
+            font = QtGui.QFont()
+            font.setBold(True)
+            return font
         
         if role == Qt.ItemDataRole.CheckStateRole:
             visible = self.spectraList[index.row()]['visible']
@@ -153,6 +182,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         #Create a threadpool for multithreading
         self.threadpool = QThreadPool()  
 
+        if server_address and not offline_mode:
+            self.osa_client = osa_client.OSAClient(server_address)
+
         self.model = SpectraViewList() # Set the model to be used and link it to the list of spectra
         self.listView.setModel(self.model) # Assign to the listView widget the model
 
@@ -190,21 +222,153 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         # Assign slot to the mousemovement
         self.proxy = pg.SignalProxy(self.plotWidget.scene().sigMouseMoved, rateLimit=60, slot=self.update_crosshair)
 
+        #Waterfall view, an image of the last sweeps (wavelength x sweep index) beside the line plot
+        self.waterfallWidget.setBackground('w')
+        self.waterfallWidget.setLabel('left', 'Sweep', **styles)
+        self.waterfallWidget.setLabel('bottom', 'Wavelength (nm)', **styles)
+        self.waterfallWidget.setXLink(self.plotWidget)
+        self.waterfall_image = pg.ImageItem(axisOrder='row-major')
+        self.waterfallWidget.addItem(self.waterfall_image)
+        self.waterfall_lut = pg.colormap.get('viridis').getLookupTable(nPts=256, alpha=True)
+        self.waterfall = None
+        self.waterfall_params = deque(maxlen=waterfall_capacity) #Configuration of each sweep in the waterfall
+        self.waterfallCheckBox.toggled.connect(self.waterfallWidget.setVisible)
+        self.waterfallWidget.scene().sigMouseClicked.connect(self.waterfallClicked)
+
         #Buttons slot connections
         self.SweepPushButton.clicked.connect(self.getAndPlotSpectrum)
+        self.SweepAllPushButton.clicked.connect(self.sweepAll)
+        self.StopPushButton.clicked.connect(self.stopSweep)
         self.DeletePushButton.clicked.connect(self.deleteTrace)
         self.SavePushButton.clicked.connect(self.saveChecked)
         self.model.check_state_changed.connect(self.handle_check_state_changed)
 
-        #Initialize values for comparison of parameters between sweep calls
+        self.sweep_workers = {} #Sweeps in progress by OSA
+        self.sweep_addresses = [] #OSAs of the last sweep, for the continuous sweep
+        self.sweep_failed = False
+
+        #OSAs that can be used. Each one has a worker thread that owns its connection, so they sweep in parallel
+        if offline_mode:
+            self.instruments = ['Offline']
+        elif server_address:
+            self.instruments = [server_address]
+        else:
+            self.instruments = [osa_driver.resource_name] + instrument_addresses
+        self.instrumentComboBox.addItems(self.instruments)
+        for widget in (self.instrumentLabel, self.instrumentComboBox, self.SweepAllPushButton):
+            widget.setVisible(len(self.instruments) > 1)
+        self.instrument_pools = {}
+        for address in self.instruments:
+            self.instrument_pools[address] = QThreadPool()
+            self.instrument_pools[address].setMaxThreadCount(1)
+        self.sent_params = {} #Parameters sent to each OSA, only the changes are sent in the next sweep
+        self.connection_status = {}
+        self.connection_workers = {} #Kept until they finish, with their signals
+
+        #Traces with different wavelength axes are resampled onto a common one to save or compare them
+        self.resampler = Resampler()
+
+        #Traces relative to a reference trace, chosen with the context menu of the list
+        self.normalizer = ReferenceNormalizer(self.resampler)
+        self.trace_counter = 0 #Unique key of each trace for the caches of the normalizer
+        self.listView.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.listView.customContextMenuRequested.connect(self.listContextMenu)
+        self.displayModeComboBox.currentIndexChanged.connect(self.displayModeChanged)
+
+        #Hidden traces are spilled to disk when the traces use more than memory_budget
+        self.trace_store = TraceStore(memory_budget * 2**20)
+        self.memory_label = QtWidgets.QLabel()
+        self.statusbar.addPermanentWidget(self.memory_label)
+        self.update_memory_label()
+
+        #Auto sampling chooses the points from the resolution, the predicted times are shown before sweeping
+        for spin_box in (self.startWavlengthDoubleSpinBox, self.stopWavelengthDoubleSpinBox,
+                         self.resoltuionNmDoubleSpinBox, self.PointsNmspinBox):
+            spin_box.valueChanged.connect(self.update_prediction)
+        self.sensitivityComboBox.currentIndexChanged.connect(self.update_prediction)
+        self.instrumentComboBox.currentIndexChanged.connect(self.update_prediction) #Each OSA has its own time model
+        self.autoPointsCheckBox.toggled.connect(self.PointsNmspinBox.setDisabled)
+        self.autoPointsCheckBox.toggled.connect(self.update_prediction)
+        self.update_prediction()
+
+        #Configuration of the last sweep, read from the inputs
         self.params = {'start': np.nan, 'stop': np.nan, 'resolution': np.nan, 'ref_level': np.nan, 
                        'sensitivity': np.nan, 'trace': np.nan, 'trace_points': np.nan}
-        
-        self.inputs = [self.startWavlengthDoubleSpinBox, self.stopWavelengthDoubleSpinBox, self.PointsNmspinBox, 
-                       self.sensitivityComboBox, self.referenceLevelDoubleSpinBox, self.resoltuionNmDoubleSpinBox]
 
-    def get_spectrum(self, updated_params):
-        spectrum = osa_driver.get_trace(updated_params)
+        #Connect to the OSA in the background, the window shows meanwhile
+        self.connection_label = QtWidgets.QLabel()
+        self.statusbar.addPermanentWidget(self.connection_label)
+        self.connect_instrument()
+        #Once the window is shown, load what the first sweep needs while the user sets it up
+        QTimer.singleShot(0, self.preload_modules)
+
+    def connect_instrument(self):
+        """Opens the connection with each OSA in its worker thread, the sweep buttons are enabled when they are ready"""
+        if offline_mode:
+            self.connection_label.setText('Offline mode')
+            return
+        self.SweepPushButton.setEnabled(False)
+        self.SweepAllPushButton.setEnabled(False)
+        for address in self.instruments:
+            self.connection_status[address] = 'connecting...'
+            if server_address:
+                worker = Worker(self.osa_client.status)
+            else:
+                worker = Worker(osa_driver.get_instrument(address).connect)
+            worker.signals.result.connect(lambda _, address=address: self.instrumentConnected(address))
+            worker.signals.error.connect(lambda error, address=address: self.instrumentConnectionFailed(address, error))
+            self.connection_workers[address] = worker
+            self.instrument_pools[address].start(worker)
+        self.update_connection_label()
+
+    def instrumentConnected(self, address):
+        if server_address:
+            where = server_address
+        else:
+            where = getattr(osa_driver.get_instrument(address).ANDO, 'resource_name', 'simulated')
+        self.connection_status[address] = f'connected ({where})'
+        self.instrument_ready()
+
+    def instrumentConnectionFailed(self, address, error):
+        self.connection_status[address] = 'not connected'
+        self.statusbar.showMessage(f'Could not connect to the OSA {address}: {error[1]}', 10000)
+        self.instrument_ready()
+
+    def instrument_ready(self):
+        """Enables the sweep buttons when all the OSAs have answered. A sweep tries to connect again to the ones that failed"""
+        self.update_connection_label()
+        if 'connecting...' not in self.connection_status.values() and not self.sweep_workers:
+            self.enable_sweep_controls()
+
+    def update_connection_label(self):
+        if len(self.instruments) == 1:
+            self.connection_label.setText(f'OSA: {self.connection_status[self.instruments[0]]}')
+        else:
+            self.connection_label.setText(', '.join(f'{address}: {status}' for address, status in self.connection_status.items()))
+
+    def preload_modules(self):
+        """Builds the unit registry and imports xarray in a worker thread"""
+        def preload():
+            get_registry()
+            importlib.import_module('xarray')
+        self.threadpool.start(Worker(preload))
+
+    def get_spectrum(self, address, params, updated_params, start_barrier=None, token=None):
+        """Sweeps with the OSA at address, runs in its worker thread. token is the sweep token of the OSA
+        when the sweep was requested, a Stop before the worker runs aborts it too"""
+        if server_address:
+            #The server keeps track of the parameters of the OSA and sends only the changes
+            return self.osa_client.get_trace(params, partial_on_abort=keep_partial_sweeps)
+        osa = osa_driver.get_instrument(address)
+        if params['trace_points'] > segmented_sweep.max_trace_points:
+            #Too many points for a single sweep, acquire it in segments.
+            #The OSA is left with the span of a segment, even if the sweep fails or is aborted,
+            #force sending the span in the next sweep
+            for key in ('start', 'stop', 'trace_points'):
+                self.sent_params[address][key] = np.nan
+            spectrum = segmented_sweep.get_segmented_trace(params, updated_params, osa=osa, token=token)
+        else:
+            spectrum = osa.get_trace(updated_params, partial_on_abort=keep_partial_sweeps, start_barrier=start_barrier, token=token)
         return spectrum
 
 
@@ -228,24 +392,132 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
     @Slot() 
     def getAndPlotSpectrum(self):
-        """Triggers the plot acquisition in a different thread. When the spectrum sweep is finished, it plots it.
-        Disables all the spinboxes buttons"""
-        for input_widget in self.inputs:
-            input_widget.setEnabled(False)
+        """Triggers the plot acquisition with the selected OSA in a different thread. When the spectrum sweep is finished, it plots it.
+        The configuration can be changed during the sweep, it applies to the next one"""
+        self.start_sweeps([self.instrumentComboBox.currentText()])
 
-        updated_params = self.get_changed_params()
-        #Create a worker for the spectrum acquisition
-        if offline_mode:
-            worker_get_spectrum = Worker(self.get_fake_spectrum)
+    @Slot()
+    def sweepAll(self):
+        """Sweeps with all the OSAs at the same time, it takes as long as the slowest one"""
+        self.start_sweeps(self.instruments)
+
+    def start_sweeps(self, addresses):
+        """Starts a sweep with each OSA in addresses, in the worker thread of each OSA.
+        The OSAs are configured first and then start sweeping at the same time"""
+        self.sweep_addresses = addresses
+        self.sweep_failed = False
+        #A segmented sweep starts several sweeps, those are not synchronized
+        if len(addresses) > 1 and self.trace_points() <= sampling.max_trace_points:
+            start_barrier = threading.Barrier(len(addresses))
+        else:
+            start_barrier = None
+        for address in addresses:
+            updated_params = self.get_changed_params(address)
+            #The configuration of the sweep and the OSA are stored with the trace
+            attrs = dict(self.params, instrument=address)
+            #Create a worker for the spectrum acquisition
+            if offline_mode:
+                worker_get_spectrum = Worker(self.get_fake_spectrum)
+            else:
+                token = None if server_address else osa_driver.get_instrument(address).sweep_token()
+                worker_get_spectrum = Worker(self.get_spectrum, address, dict(self.params), updated_params, start_barrier, token)
+            worker_get_spectrum.signals.result.connect(lambda spectrum, attrs=attrs: self.sweepResult(spectrum, attrs))
+            worker_get_spectrum.signals.error.connect(lambda error, attrs=attrs, worker=worker_get_spectrum: self.sweepFailed(error, attrs, worker))
+            worker_get_spectrum.signals.finished.connect(lambda worker=worker_get_spectrum: self.sweepFinished(worker))
+            self.sweep_workers[address] = worker_get_spectrum
+            self.instrument_pools[address].start(worker_get_spectrum)
+        self.SweepPushButton.setEnabled(False)
+        self.SweepAllPushButton.setEnabled(False)
+        self.StopPushButton.setEnabled(not offline_mode)
+
+    @Slot()
+    def stopSweep(self):
+        """Aborts the sweeps in progress. The controls are enabled right away, a new sweep
+        waits in the driver until the OSA has stopped the aborted one"""
+        for address in self.sweep_workers:
+            if server_address:
+                self.osa_client.abort_sweep()
+            else:
+                osa_driver.get_instrument(address).abort_sweep()
+        self.sweep_workers = {}
+        self.enable_sweep_controls()
+        self.statusbar.showMessage('Sweep aborted', 5000)
+
+    def sweepFinished(self, worker):
+        #Ignore a worker that was aborted, a new sweep may have started since then
+        addresses = [address for address, sweep_worker in self.sweep_workers.items() if sweep_worker is worker]
+        if not addresses:
+            return
+        del self.sweep_workers[addresses[0]]
+        if not self.sweep_workers:
+            self.enable_sweep_controls()
+            self.update_prediction() #With the times measured in this sweep
+            if self.continuousCheckBox.isChecked() and not self.sweep_failed:
+                self.start_sweeps(self.sweep_addresses)
+
+    def sweepFailed(self, error, attrs, worker):
+        exctype, value, _ = error
+        #The settings may not have reached the OSA, send all of them in the next sweep
+        self.sent_params.pop(attrs['instrument'], None)
+        #A worker dropped by stopSweep does not stop the sweeps started since then
+        current = worker in self.sweep_workers.values()
+        if current:
+            self.sweep_failed = True
+        partial = getattr(value, 'partial', None)
+        if partial is not None:
+            self.plotSpectrum(partial, params=attrs)
+        elif current and exctype.__name__ != 'SweepAborted':
+            where = f' ({attrs["instrument"]})' if len(self.instruments) > 1 else ''
+            self.statusbar.showMessage(f'Sweep failed{where}: {value}', 10000)
+
+    def enable_sweep_controls(self):
+        self.SweepPushButton.setEnabled(True)
+        self.SweepAllPushButton.setEnabled(True)
+        self.StopPushButton.setEnabled(False)
+
+
+    def sweepResult(self, spectrum: dict, attrs: dict = None):
+        """Sends a new sweep to the waterfall or to the list of spectra. attrs are the configuration and the OSA of the sweep"""
+        if save_every_sweep:
+            to_dataarray(spectrum, f'Trace {len(self.model.spectraList)}', attrs=attrs).to_netcdf(f'./temp/{timestamp()}.nc')
+        if self.waterfallCheckBox.isChecked():
+            self.addToWaterfall(spectrum, attrs)
         else:
-            worker_get_spectrum = Worker(self.get_spectrum, updated_params)
-        worker_get_spectrum.signals.result.connect(self.plotSpectrum)
-        self.threadpool.start(worker_get_spectrum)
+            self.plotSpectrum(spectrum, params=attrs)
 
+    def addToWaterfall(self, spectrum: dict, params: dict = None):
+        """Adds the sweep as a new row of the waterfall. Only the new row is colour mapped,
+        the image item shows a view of the ring buffer"""
+        wavelength = spectrum['wavelength'].to(ureg.nm).magnitude
+        power = spectrum['power'].to(ureg.dBm).magnitude
+        if self.waterfall is None or not self.waterfall.accepts(wavelength):
+            #New wavelength axis, start a new history with the colour levels of this sweep
+            levels = (np.min(power), max(np.max(power), np.min(power) + 10))
+            self.waterfall = WaterfallBuffer(waterfall_capacity, wavelength, self.waterfall_lut, levels)
+            self.waterfall_params.clear()
+        self.waterfall.push(power)
+        self.waterfall_params.append(params)
+        image = self.waterfall.view()
+        self.waterfall_image.setImage(image, autoLevels=False)
+        self.waterfall_image.setRect(QRectF(wavelength[0], self.waterfall.first_index(),
+                                            wavelength[-1] - wavelength[0], image.shape[0]))
+
+    @Slot()
+    def waterfallClicked(self, event):
+        """Adds the clicked row of the waterfall to the list of spectra"""
+        if self.waterfall is None:
+            return
+        position = self.waterfallWidget.getPlotItem().vb.mapSceneToView(event.scenePos())
+        index = int(np.floor(position.y()))
+        power = self.waterfall.sweep(index)
+        if power is not None:
+            self.plotSpectrum({'wavelength': Q_(self.waterfall.wavelength, ureg.nm),
+                               'power': Q_(power, ureg.dBm)}, name=f'Sweep {index}',
+                              params=self.waterfall_params[index - self.waterfall.first_index()])
 
     @Slot()
-    def plotSpectrum(self, spectrum: dict):
-        """Plots the spectrum and adds it to the list of spectra"""
+    def plotSpectrum(self, spectrum: dict, name: str = None, params: dict = None):
+        """Plots the spectrum and adds it to the list of spectra, with the configuration of its sweep in params"""
         #Get the previous color from the list or start with the first one
         if len(self.model.spectraList) != 0:
             previous_color = self.model.spectraList[-1]['color']
@@ -256,18 +528,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         pen = pg.mkPen(color= QtGui.QColor(color))
         wavelength = spectrum['wavelength'].to(ureg.nm).magnitude
         power = spectrum['power'].to(ureg.dBm).magnitude
-        name = f'Trace {len(self.model.spectraList)}'
-        power_array = xr.DataArray( data = power ,
-                                   coords = {'Wavelength': wavelength},
-                                   attrs= {'units': f'{spectrum['power'].units:~}'},
-                                   name= name)
+        name = name or f'Trace {len(self.model.spectraList)}'
+        power_array = to_dataarray(spectrum, name, attrs=params)
         print(power_array.name)
-        power_array['Wavelength'].attrs['units'] = f'{spectrum['wavelength'].units:~}'
-
-        if save_every_sweep:
-            power_array.to_netcdf(f'./temp/{datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")}.nc')
-            
-
 
         plot = self.plotWidget.plot(wavelength, power, name = name, pen = pen)
         #Add the trace to the list of traces
@@ -277,10 +540,59 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             'pen': pen,
             'visible': True,
             'spectrum': power_array,
+            'key': self.trace_counter,
+            'instrument': (params or {}).get('instrument'),
         }
+        self.trace_counter += 1
         self.model.spectraList.append(trace_info)
+        self.trace_store.add(trace_info['key'], trace_nbytes(power_array))
+        if self.normalizer.active():
+            self.refresh_display([trace_info])
         # Trigger refresh.
         self.model.layoutChanged.emit()
+        self.enforce_memory_budget()
+
+    def enforce_memory_budget(self):
+        """Spills the least recently viewed hidden traces while the traces use more than the budget.
+        The reference is not spilled, the normalizer keeps its arrays"""
+        if self.trace_store.over_budget():
+            hidden = {trace['key']: trace for trace in self.model.spectraList if not trace['visible'] and not trace.get('reference')}
+            for key in self.trace_store.to_spill(hidden):
+                self.spill_trace(hidden[key])
+        self.update_memory_label()
+
+    def spill_trace(self, trace):
+        """Writes a hidden trace to disk and releases its arrays and plot item"""
+        spectrum = trace['spectrum']
+        self.trace_store.spill(trace['key'], spectrum['Wavelength'].values, spectrum.values)
+        #An empty copy keeps the name and the attributes
+        trace['spectrum'] = spectrum.isel(Wavelength=slice(0, 0)).copy()
+        trace['plot'] = None
+        trace['spilled'] = True
+        self.normalizer.drop_cache(trace['key'])
+
+    def load_trace(self, trace):
+        """Reads back a spilled trace and creates its plot item again, not added to the plot"""
+        if not trace.get('spilled'):
+            return
+        import xarray as xr
+        wavelength, power = self.trace_store.load(trace['key'])
+        empty = trace['spectrum']
+        power_array = xr.DataArray(data = np.array(power),
+                                   coords = {'Wavelength': np.array(wavelength)},
+                                   attrs = empty.attrs,
+                                   name = empty.name)
+        power_array['Wavelength'].attrs.update(empty['Wavelength'].attrs)
+        trace['spectrum'] = power_array
+        trace['plot'] = pg.PlotDataItem(power_array['Wavelength'].values, power_array.values, name = power_array.name, pen = trace['pen'])
+        trace['spilled'] = False
+        self.trace_store.add(trace['key'], trace_nbytes(power_array))
+
+    def update_memory_label(self):
+        text = f'Traces: {self.trace_store.memory_use() / 2**20:.1f} MB'
+        if self.trace_store.spilled:
+            text += f' ({len(self.trace_store.spilled)} on disk)'
+        self.memory_label.setText(text)
 
         
     @Slot()
@@ -298,36 +610,43 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 # Indexes is a list of a single item in single-select mode.
                 index = indexes[0]
                 #Remove the spectrum from the plot
-                self.plotWidget.removeItem(self.model.spectraList[index.row()]['plot'])
+                if self.model.spectraList[index.row()]['plot'] is not None:
+                    self.plotWidget.removeItem(self.model.spectraList[index.row()]['plot'])
+                was_reference = self.model.spectraList[index.row()].get('reference')
+                self.normalizer.forget(self.model.spectraList[index.row()]['key'])
+                self.trace_store.remove(self.model.spectraList[index.row()]['key'])
                 # Remove the item and refresh.
                 del self.model.spectraList[index.row()]
                 self.model.layoutChanged.emit()
+                self.update_memory_label()
+                if was_reference:
+                    self.refresh_display()
                 # Clear the selection (as it is no longer valid).
                 self.listView.clearSelection()
         else:
             QtWidgets.QMessageBox.warning(self, "No trace selected", "Please select a trace to delete")
-        
-        #If the list is empty, enable the buttons
-        if len(self.model.spectraList) == 0:
-            for input_widget in self.inputs:
-                input_widget.setEnabled(True)
 
 
     @Slot()
     def saveChecked(self):
         """Save all the checked traces to a file, asking for name and format"""
+        import xarray as xr
         #Get the checked traces
         checked_traces = [trace for trace in self.model.spectraList if trace['visible']]
         if len(checked_traces) == 0:
             QtWidgets.QMessageBox.warning(self, "No traces selected", "Please select at least one trace to save")
             return
+        for trace in checked_traces:
+            self.load_trace(trace)
         #Ask the user for additional notes
         notes, ok = QtWidgets.QInputDialog.getText(self, "Additional notes", "Please enter additional notes for the file (optional)")  
         if not ok:
             return
         #Add the date and time  to the notes
         date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        traces_dataset = xr.merge([trace['spectrum'] for trace in checked_traces], compat = 'no_conflicts')
+        #Each trace keeps the configuration of its sweep, the file keeps the values shared by all of them
+        traces_dataset = xr.merge(to_common_axis(self.export_arrays(checked_traces), self.resampler),
+                                  compat = 'no_conflicts', combine_attrs = 'drop_conflicts')
 
         #Ask the user for the name and format of the file
         file_type, ok = QtWidgets.QInputDialog.getItem(self, "File format", "Please select the file format\nSelect NetCDF for processing in python",
@@ -344,12 +663,6 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
             traces_dataset.attrs['notes'] = notes
             traces_dataset.attrs['date'] = date
-            for key, value in self.params.items():
-                if type(value) == ureg.Quantity:
-                    traces_dataset.attrs[key] = value.magnitude
-                    traces_dataset.attrs[f'{key}_units'] = f'{value.units:~}'
-                else:
-                    traces_dataset.attrs[key] = str(value)
             traces_dataset.to_netcdf(f'{name}')
             QtWidgets.QMessageBox.information(self, "File saved", f"File saved as {name}")
             
@@ -357,7 +670,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.save_to_csv(traces_dataset, notes, date)
 
 
-    def save_to_csv(self, traces_dataset: xr.Dataset, notes: str, date: str):
+    def save_to_csv(self, traces_dataset: 'xr.Dataset', notes: str, date: str):
+        import csv
         #Ask the user for the name of the file
         #Get the name and format from the user
         name, ok = QtWidgets.QFileDialog.getSaveFileName(self, "Save file", "", "CSV Files (*.csv);;All Files (*)")
@@ -370,7 +684,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             writer = csv.writer(f)
 
             writer.writerow([f'Notes: {notes}  Date: {date}'])
-            writer.writerow([f'Resolution: {self.params['resolution']} nm'])
+            resolutions = {str(traces_dataset[array].attrs.get('resolution')) for array in traces_dataset.data_vars}
+            writer.writerow([f'Resolution: {", ".join(sorted(resolutions))} nm'])
             
             # Convert to a dictionary for easier manipulation
             data_dict = traces_dataset.to_dataframe().reset_index().to_dict(orient='list')
@@ -382,7 +697,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
             wavelength_units = traces_dataset['Wavelength'].attrs['units']
             power_units = traces_dataset.attrs['units']
-            col_names = [f'{array} ({power_units})' for array in arrays ]
+            instruments = {array: traces_dataset[array].attrs.get('instrument') for array in arrays}
+            if len(set(instruments.values())) > 1:
+                col_names = [f'{array} [{instruments[array]}] ({power_units})' for array in arrays]
+            else:
+                col_names = [f'{array} ({power_units})' for array in arrays ]
 
             # Write the header
             writer.writerow([f'Wavelength ({wavelength_units})'] + col_names)
@@ -392,14 +711,84 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 row = [Wavelength[i]] + [data_dict[array][i] for array in arrays]
                 writer.writerow(row)
 
+    @Slot()
+    def listContextMenu(self, position):
+        """Context menu of the list of traces, to choose the reference trace"""
+        index = self.listView.indexAt(position)
+        menu = QtWidgets.QMenu(self)
+        if index.isValid():
+            menu.addAction('Set as reference', lambda: self.setReference(index.row()))
+        if self.normalizer.reference_key is not None:
+            menu.addAction('Clear reference', lambda: self.setReference(None))
+        if not menu.isEmpty():
+            menu.exec(self.listView.viewport().mapToGlobal(position))
+
+    def setReference(self, row):
+        """Sets the trace in row as reference (None removes it) and redraws the traces relative to it"""
+        for trace in self.model.spectraList:
+            trace['reference'] = False
+        if row is None:
+            self.normalizer.set_reference(None, None, None)
+        else:
+            trace = self.model.spectraList[row]
+            trace['reference'] = True
+            self.load_trace(trace)
+            self.normalizer.set_reference(trace['key'], trace['spectrum']['Wavelength'].values, trace['spectrum'].values)
+            if self.displayModeComboBox.currentIndex() == 0:
+                self.displayModeComboBox.setCurrentIndex(1) #Show the difference, that's why the reference was set
+        self.model.layoutChanged.emit()
+        self.refresh_display()
+        self.enforce_memory_budget()
+
+    @Slot()
+    def displayModeChanged(self, index):
+        self.normalizer.set_mode(modes[index])
+        self.refresh_display()
+
+    def refresh_display(self, traces=None):
+        """Redraws traces (all the visible ones by default) in the current display mode"""
+        if traces is None:
+            traces = [trace for trace in self.model.spectraList if trace['visible']]
+        if not self.normalizer.active():
+            self.plotWidget.setLabel('left', 'Power (dBm)')
+        elif self.normalizer.mode == 'difference':
+            self.plotWidget.setLabel('left', 'Relative power (dB)')
+        else:
+            self.plotWidget.setLabel('left', 'Power ratio')
+        shown = self.normalizer.normalize([(trace['key'], trace['spectrum']['Wavelength'].values, trace['spectrum'].values)
+                                          for trace in traces])
+        for trace, power in zip(traces, shown):
+            trace['plot'].setData(trace['spectrum']['Wavelength'].values, power)
+
+    def export_arrays(self, traces):
+        """DataArrays of traces as they are displayed, relative to the reference if there is one"""
+        if not self.normalizer.active():
+            return [trace['spectrum'] for trace in traces]
+        shown = self.normalizer.normalize([(trace['key'], trace['spectrum']['Wavelength'].values, trace['spectrum'].values)
+                                          for trace in traces])
+        reference_name = next(trace['spectrum'].name for trace in self.model.spectraList if trace.get('reference'))
+        arrays = []
+        for trace, power in zip(traces, shown):
+            power_array = trace['spectrum'].copy(data=power)
+            power_array.attrs['units'] = mode_units[self.normalizer.mode]
+            power_array.attrs['reference'] = reference_name
+            power_array.attrs['normalization'] = self.normalizer.mode
+            arrays.append(power_array)
+        return arrays
+
     @Slot()
     def handle_check_state_changed(self, index, state):
         """Show or hide the trace in the plot"""
-        trace = self.model.spectraList[index.row()]['plot']
+        trace_info = self.model.spectraList[index.row()]
+        self.trace_store.touch(trace_info['key'])
         if state == Qt.CheckState.Checked: #If checked make it visible
-            self.plotWidget.addItem(trace)
+            self.load_trace(trace_info)
+            self.plotWidget.addItem(trace_info['plot'])
+            #Hidden traces are not redrawn when the display mode or the reference changes
+            self.refresh_display([trace_info])
         else:
-            self.plotWidget.removeItem(trace) 
+            self.plotWidget.removeItem(trace_info['plot'])
+        self.enforce_memory_budget()
     
     @Slot()
     def update_crosshair(self, e):
@@ -411,22 +800,46 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.x_label.setText(f'X: {mousePoint.x():.2f}')
             self.y_label.setText(f'Y: {mousePoint.y():.2f}')
 
-    def get_changed_params(self):
-         
-        reference_params = self.params.copy()
+    def trace_points(self):
+        """Trace points of the span, from the resolution in auto mode or from the points/nm"""
+        start = self.startWavlengthDoubleSpinBox.value()
+        stop = self.stopWavelengthDoubleSpinBox.value()
+        if self.autoPointsCheckBox.isChecked():
+            return sampling.auto_trace_points(start, stop, self.resoltuionNmDoubleSpinBox.value())
+        return int(stop-start) * self.PointsNmspinBox.value() + 1
+
+    @Slot()
+    def update_prediction(self, *_):
+        """Shows the points and the predicted sweep and transfer time of the next sweep"""
+        trace_points = self.trace_points()
+        if offline_mode or server_address:
+            timing = None #The default model of sampling.py, the driver is not loaded
+        else:
+            timing = osa_driver.get_instrument(self.instrumentComboBox.currentText()).sweep_timing
+        sweep_time, transfer_time = sampling.predict_times(trace_points, self.sens_dict[self.sensitivityComboBox.currentText()], timing)
+        text = f'{trace_points} points, sweep ~{sweep_time:.1f} s + transfer ~{transfer_time:.1f} s'
+        if sampling.undersampled(self.startWavlengthDoubleSpinBox.value(), self.stopWavelengthDoubleSpinBox.value(),
+                                 self.resoltuionNmDoubleSpinBox.value(), trace_points):
+            text += ' (undersampled)'
+        self.predictionLabel.setText(text)
+
+    def get_changed_params(self, address):
+        """Reads the configuration from the inputs into self.params. Returns the parameters that
+        changed since the last sweep of the OSA at address, the only ones that are sent to it"""
         start = self.startWavlengthDoubleSpinBox.value() * ureg.nm
         stop = self.stopWavelengthDoubleSpinBox.value() * ureg.nm
-        points_per_nm = self.PointsNmspinBox.value()
         self.params = dict(
             start = start,
             stop = stop,
             resolution = self.resoltuionNmDoubleSpinBox.value() * ureg.nm,
             ref_level = self.referenceLevelDoubleSpinBox.value() * ureg.dBm,
-            trace_points = int(stop.magnitude-start.magnitude) * points_per_nm + 1,
+            trace_points = self.trace_points(),
             sensitivity = self.sens_dict[self.sensitivityComboBox.currentText()],
             trace = 'A'
             )
+        reference_params = self.sent_params.get(address, dict.fromkeys(self.params, np.nan))
         changed_params = {k: v for k, v in self.params.items() if v != reference_params[k]}
+        self.sent_params[address] = dict(self.params)
 
         return changed_params       
 
@@ -0,0 +1,179 @@
+"""
+asyncio version of osa_driver. Cancelling a get_trace (or reaching its timeout) stops the sweep with STP.
+
+    osa = AsyncOSA()
+    spectrum = await osa.get_trace({'start': 1500, 'stop': 1600}, timeout=120)
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import osa_driver
+from osa_driver import parse_data
+from units import ureg, Q_, to_magnitude
+
+#Time in s between SWEEP? queries while waiting for the end of a sweep
+poll_interval = 0.5
+
+
+class AsyncOSA:
+    """Asynchronous interface to one OSA. resource is a pyvisa resource (or a SimulatedOSA),
+    by default the connection of osa_driver"""
+
+    def __init__(self, resource=None):
+        self.resource = resource
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='osa')
+        self._lock = None
+        #Time to change each setting, the model of osa_driver's default OSA when it is its connection
+        if resource is None:
+            self.setting_latency = osa_driver.default.setting_latency
+        else:
+            self.setting_latency = dict(osa_driver.initial_setting_latency)
+        #With the connection of osa_driver, the sweeps also hold its bus lock (taken in the worker thread)
+        self.bus_lock = osa_driver.default.bus_lock if resource is None else None
+
+    @property
+    def lock(self):
+        """Held during a whole sweep so that commands from other coroutines do not get in the middle.
+        Created on first use, in the running event loop"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def record_latency(self, setting, elapsed):
+        """Updates the running average of the time it takes to change a setting"""
+        self.setting_latency[setting] += osa_driver.latency_smoothing * (elapsed - self.setting_latency[setting])
+
+    async def _run(self, function, *args):
+        """Runs function in the worker thread of the instrument"""
+        loop = asyncio.get_running_loop()
+        if self.resource is None:
+            self.resource = await loop.run_in_executor(self.executor, osa_driver.instrument)
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def query(self, command):
+        """Sends command in the worker thread of the instrument and returns the answer"""
+        return await self._run(lambda: self.resource.query(command))
+
+    async def query_data(self, command):
+        """Sends WDAT or LDAT and converts the answer to an array, also in the worker thread"""
+        return await self._run(lambda: parse_data(self.resource.query(command)))
+
+    async def _set_and_check(self, command, query, expected, convert=float):
+        await self.query(command)
+        received = await self.query(query)
+        assert convert(received.strip()) == expected, f'{query[:-1]} not set correctly, expected {expected}, got {received}'
+
+    async def set_start(self, start):
+        assert start>=600 and start<=1750
+        await self._set_and_check(f'STAWL{start:.2f}', 'STAWL?', start)
+
+    async def set_stop(self, stop):
+        assert stop>=600 and stop<=1750
+        await self._set_and_check(f'STPWL{stop:.2f}', 'STPWL?', stop)
+
+    async def set_ref(self, ref_level):
+        assert ref_level>=-90 and ref_level<=20
+        await self._set_and_check(f'REFL{ref_level:.1f}', 'REFL?', ref_level)
+
+    async def set_resolution(self, resolution):
+        assert resolution>=0.01 and resolution<=2.0
+        await self._set_and_check(f'RESLN{resolution:.2f}', 'RESLN?', resolution)
+
+    async def set_trace_points(self, trace_points):
+        assert trace_points>=11 and trace_points<=20001
+        await self._set_and_check(f'SMPL{trace_points}', 'SMPL?', trace_points, int)
+
+    async def active_trace(self, trace):
+        assert trace in ('A','B','C')
+        await self.query(f'ACTV{trace}')
+
+    async def sensitivity_mode(self, sensitivity):
+        assert sensitivity in ('SNHD', 'SNAT', 'SHI1', 'SHI2', 'SHI3')
+        await self.query(sensitivity)
+
+    async def configure(self, updated_params):
+        """Same as osa_driver.configure, returns the active trace"""
+        trace = updated_params.get('trace', 'A')
+        setters = [('trace', self.active_trace, trace, None)]
+        if 'start' in updated_params and 'stop' in updated_params:
+            setters.append(('start', self.set_start, updated_params['start'], ureg.nm))
+        if 'stop' in updated_params:
+            setters.append(('stop', self.set_stop, updated_params['stop'], ureg.nm))
+        if 'ref_level' in updated_params:
+            setters.append(('ref_level', self.set_ref, updated_params['ref_level'], ureg.dBm))
+        if 'resolution' in updated_params:
+            setters.append(('resolution', self.set_resolution, updated_params['resolution'], ureg.nm))
+        if 'sensitivity' in updated_params:
+            setters.append(('sensitivity', self.sensitivity_mode, updated_params['sensitivity'], None))
+        if 'trace_points' in updated_params:
+            setters.append(('trace_points', self.set_trace_points, updated_params['trace_points'], None))
+        for setting, setter, value, unit in setters:
+            if unit is not None:
+                value = to_magnitude(value, unit)
+            set_time = time.perf_counter()
+            await setter(value)
+            self.record_latency(setting, time.perf_counter() - set_time)
+        return trace
+
+    async def wait_sweep(self):
+        """Waits until the sweep in progress is finished"""
+        while (await self.query('SWEEP?')).strip() != '0':
+            await asyncio.sleep(poll_interval)
+
+    async def stop_sweep(self):
+        await self.query('STP')
+
+    async def single_sweep(self):
+        """Performs a single sweep and waits until it is finished. If it is cancelled, the sweep is stopped"""
+        await self.query('SGL')
+        try:
+            await self.wait_sweep()
+        except asyncio.CancelledError:
+            #Stop the OSA even though this coroutine is being cancelled
+            await asyncio.shield(self.stop_sweep())
+            raise
+
+    async def read_trace(self, trace='A'):
+        wavelength = await self.query_data('WDAT'+trace)
+        power = await self.query_data('LDAT'+trace)
+        return {
+            'wavelength': Q_(wavelength, ureg.nm),
+            'power': Q_(power, ureg.dBm),
+        }
+
+    async def acquire_bus(self):
+        """Takes the bus lock of osa_driver in the worker thread, so the sync driver does not send commands meanwhile"""
+        acquired = asyncio.get_running_loop().run_in_executor(self.executor, self.bus_lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            #Release it as soon as it is taken
+            acquired.add_done_callback(lambda _: self.executor.submit(self.bus_lock.release))
+            raise
+
+    async def get_trace(self, updated_params, timeout=None):
+        """Same as osa_driver.get_trace. Raises asyncio.TimeoutError if it takes more than timeout s"""
+        async def sweep():
+            async with self.lock:
+                if self.bus_lock is not None:
+                    await self.acquire_bus()
+                try:
+                    trace = await self.configure(updated_params)
+                    await self.single_sweep()
+                    return await self.read_trace(trace)
+                finally:
+                    if self.bus_lock is not None:
+                        await asyncio.shield(self._run(self.bus_lock.release))
+        return await asyncio.wait_for(sweep(), timeout)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def install_qt_event_loop():
+    """Makes asyncio use the Qt event loop (PySide6 6.6 or newer), so that the coroutines of
+    AsyncOSA run in the GUI thread without blocking it"""
+    from PySide6 import QtAsyncio
+    asyncio.set_event_loop_policy(QtAsyncio.QAsyncioEventLoopPolicy())
@@ -0,0 +1,139 @@
+"""
+Client of osa_server.py, get_trace returns the same dictionary as osa_driver.get_trace.
+
+    osa = OSAClient('localhost:5025')
+    spectrum = osa.get_trace({'start': 1500, 'stop': 1600, 'trace_points': 1001})
+"""
+
+import socket
+import threading
+
+from osa_protocol import parse_address, send_message, recv_message
+from units import ureg, Q_
+
+#Units in which the server takes each parameter
+param_units = {'start': 'nm', 'stop': 'nm', 'resolution': 'nm', 'ref_level': 'dBm'}
+
+
+class ServerError(Exception):
+    """The server could not carry out the request"""
+
+
+class SweepAborted(ServerError):
+    """The sweep was aborted, partial is the trace acquired until then if it was requested"""
+
+    def __init__(self, partial=None):
+        super().__init__('Sweep aborted')
+        self.partial = partial
+
+
+def plain_params(params):
+    """Converts the quantities of params to plain numbers in the units of the server"""
+    plain = {}
+    for key, value in params.items():
+        if hasattr(value, 'to') and key in param_units:
+            value = value.to(param_units[key]).magnitude
+        elif hasattr(value, 'item'):
+            value = value.item() #numpy scalars are not JSON serializable
+        plain[key] = value
+    return plain
+
+
+def to_spectrum(arrays):
+    return {
+        'wavelength': Q_(arrays['wavelength'].astype(float), ureg.nm),
+        'power': Q_(arrays['power'].astype(float), ureg.dBm),
+    }
+
+
+class OSAClient:
+    """Connection with the acquisition server. It can be shared between threads"""
+
+    def __init__(self, address='localhost:5025', timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.last_info = None #Header of the last trace received: sweep_id, date, sweep_time_s, params
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(socket.AF_UNIX if family == 'unix' else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        return sock
+
+    def _request(self, header):
+        with self.lock:
+            if self.sock is None:
+                self.sock = self._connect()
+            try:
+                send_message(self.sock, header)
+                reply, arrays = recv_message(self.sock)
+            except OSError:
+                self.close()
+                raise
+        if not reply.pop('ok'):
+            if reply.get('aborted'):
+                raise SweepAborted(to_spectrum(arrays) if arrays else None)
+            raise ServerError(reply['error'])
+        return reply, arrays
+
+    def get_trace(self, params=None, partial_on_abort=False):
+        """Sweeps with params (the ones not given keep their value) and returns the spectrum.
+        Raises SweepAborted if abort_sweep() is called meanwhile, from this or any other client"""
+        reply, arrays = self._request({'cmd': 'sweep', 'params': plain_params(params or {}),
+                                       'partial_on_abort': partial_on_abort})
+        self.last_info = reply
+        return to_spectrum(arrays)
+
+    def configure(self, params):
+        """Sends params to the OSA without sweeping"""
+        self._request({'cmd': 'configure', 'params': plain_params(params)})
+
+    def latest(self):
+        """Returns the last trace acquired by the server, without sweeping"""
+        reply, arrays = self._request({'cmd': 'latest'})
+        self.last_info = reply
+        return to_spectrum(arrays)
+
+    def abort_sweep(self):
+        """Aborts the sweep in progress. Uses its own connection, since the one of the client
+        may be waiting for that sweep"""
+        sock = self._connect()
+        try:
+            send_message(sock, {'cmd': 'abort'})
+            recv_message(sock)
+        finally:
+            sock.close()
+
+    def status(self):
+        reply, _ = self._request({'cmd': 'status'})
+        return reply
+
+    def subscribe(self):
+        """Yields every new trace acquired by the server, for as long as it is iterated.
+        Uses its own connection, so the client can keep sweeping meanwhile"""
+        sock = self._connect()
+        sock.settimeout(None) #There can be a long time between sweeps
+        try:
+            send_message(sock, {'cmd': 'subscribe'})
+            recv_message(sock)
+            while True:
+                reply, arrays = recv_message(sock)
+                reply.pop('ok')
+                self.last_info = reply
+                yield to_spectrum(arrays)
+        finally:
+            sock.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,137 +1,362 @@
-
 """
+Each OSA on the GPIB bus is an OSA object (get_instrument(address)), the module functions act on the default one.
 
 @author: Javier
 
 2024
 """
 
-import pyvisa
+import os
+import threading
 import numpy as np
 import time
-from pint import UnitRegistry
-import pint
-ureg = UnitRegistry(autoconvert_offset_to_baseunit=True)
-Q_ = ureg.Quantity
-
-
-rm = pyvisa.ResourceManager()
-# print(rm.list_resources())
-
-
-
-ANDO = rm.open_resource('GPIB0::3::INSTR')
-
-
-ANDO.timeout = 40000 #ms
-
-def get_trace(updated_params):
-    """updated_params is a dictonary with the parameters to be updated, if a parameter is not in the dictonary, it will be ignored"""
-    if 'trace' in updated_params:
-        trace = updated_params['trace']
-    else:
-        trace = 'A'  # Default value if 'trace' is not in the dictionary
-    #Trace has to be A,B or C 
-    assert trace in ('A','B','C')
-    active_trace(trace)
-
-    if 'start' in updated_params and 'stop' in updated_params:
-        start = updated_params['start']
-        if isinstance(start, pint.Quantity):
-            start = start.to(ureg.nm).magnitude
-        print(f'Converted start: {start}, type: {type(start)}')
-        set_start(start)
-        
-    if 'stop' in updated_params:
-        stop = updated_params['stop']
-        if isinstance(stop, pint.Quantity):
-            stop = stop.to(ureg.nm).magnitude
-        set_stop(stop)
-
-    if 'ref_level' in updated_params:
-        ref = updated_params['ref_level']
-        if isinstance(ref, pint.Quantity):
-            ref = ref.to(ureg.dBm).magnitude
-        set_ref(ref)
-
-    if 'resolution' in updated_params:
-        resolution = updated_params['resolution']
-        if isinstance(resolution, pint.Quantity):
-            resolution = resolution.to(ureg.nm).magnitude
-        set_resolution(resolution)
-
-    if 'sensitivity' in updated_params:
-        sensitivity_mode(updated_params['sensitivity'])
-    
-    if 'trace_points' in updated_params:
-        set_trace_points(updated_params['trace_points'])
-
-    #Perform a sweep
-    ANDO.query('SGL')
-    #Ensure that the sweep is finished
-    sweep_status = ANDO.query('SWEEP?')
-    while sweep_status != '0':
-        time.sleep(1)
-        sweep_status = ANDO.query('SWEEP?').strip()
+import sampling
+from units import ureg, Q_, to_magnitude
+
+
+resource_name = 'GPIB0::3::INSTR' #Address of the default OSA
+poll_interval = 0.2 #s between SWEEP? queries while waiting for the end of a sweep
+
+
+class SweepAborted(Exception):
+    """The sweep was stopped by abort_sweep(). partial is the trace read after stopping, if it was requested"""
+
+    def __init__(self, partial=None):
+        super().__init__('Sweep aborted')
+        self.partial = partial
+
+
+#Time in s that each setting takes to change in the OSA. Used by sweep_scheduler to order the sweeps.
+#These are rough estimates, every OSA starts with a copy and updates it with a running average every
+#time a setting is sent (OSA.setting_latency).
+initial_setting_latency = {
+    'trace': 0.1,
+    'start': 0.5,
+    'stop': 0.5,
+    'ref_level': 0.3,
+    'resolution': 2.0,
+    'sensitivity': 3.0,
+    'trace_points': 0.5,
+}
+latency_smoothing = 0.3 #Weight of the newest measurement in the running average
+
+
+class OSA:
+    """Driver of one OSA. resource is its GPIB address, None for resource_name at the time of connecting"""
+
+    def __init__(self, resource=None, simulate=None):
+        self.resource = resource
+        self.simulate = simulate
+        self.ANDO = None #Opened by connect(), on the first command if it was not called before
+        #Only one sweep at a time, a new one waits until an aborted one has stopped the OSA
+        self.bus_lock = threading.RLock()
+        #Set by abort_sweep() from another thread to wake up the sweep in progress
+        self.sweep_abort = threading.Event()
+        #Number of abort_sweep() calls. A sweep is aborted if it changes after the sweep was requested
+        self.aborts = 0
+        self._abort_lock = threading.Lock()
+        self.start_barrier = None #Barrier the sweep is waiting at, broken by abort_sweep()
+        self.sensitivity = None #Last sensitivity mode sent, to update the sweep time model
+        #Models of this OSA, other OSAs on the bus can be slower or faster
+        self.setting_latency = dict(initial_setting_latency)
+        self.sweep_timing = sampling.initial_timing()
+
+    @property
+    def address(self):
+        return self.resource or resource_name
+
+    def connect(self, resource=None, simulate=None):
+        """Opens the connection with the OSA at the GPIB address resource (the one of the driver by default).
+        With simulate, or the environment variable OSA_SIMULATE=1, the simulated OSA of osa_sim.py is used instead"""
+        if resource is not None:
+            self.resource = resource
+        if simulate is None:
+            simulate = self.simulate
+        if simulate is None:
+            simulate = os.environ.get('OSA_SIMULATE') == '1'
+        if simulate:
+            import osa_sim
+            self.ANDO = osa_sim.SimulatedOSA()
+        else:
+            import pyvisa
+            rm = pyvisa.ResourceManager()
+            # print(rm.list_resources())
+            self.ANDO = rm.open_resource(self.address)
+        self.ANDO.timeout = 40000 #ms
+        with instruments_lock:
+            instruments[self.address] = self
+        return self.ANDO
+
+    def instrument(self):
+        """Returns the connection with the OSA, opening it if needed"""
+        if self.ANDO is None:
+            self.connect()
+        return self.ANDO
+
+    def sweep_token(self):
+        """Identifies the aborts done until now. A sweep requested with this token is aborted by any later abort_sweep()"""
+        return self.aborts
+
+    def get_trace(self, updated_params, partial_on_abort=False, start_barrier=None, token=None):
+        """updated_params is a dictonary with the parameters to be updated, if a parameter is not in the dictonary, it will be ignored.
+        Raises SweepAborted if abort_sweep() is called during the sweep, with the partial trace if partial_on_abort.
+        start_barrier is a threading.Barrier shared with the sweeps of other OSAs, to start them at the same time.
+        token is sweep_token() when the sweep was requested, so that an abort while it waits for the bus stops it too.
+        By default it is taken now: an abort requested before does not affect this sweep"""
+        if token is None:
+            token = self.sweep_token()
+        with self.bus_lock:
+            self.sweep_abort.clear() #The aborts are counted in self.aborts, the event only wakes up the sweep
+            try:
+                if self.aborts != token: #Aborted while waiting for the bus
+                    raise SweepAborted()
+                trace = self.configure(updated_params)
+                if start_barrier is not None:
+                    self.start_barrier = start_barrier
+                    if self.aborts != token:
+                        raise SweepAborted()
+                    try:
+                        start_barrier.wait()
+                    except threading.BrokenBarrierError:
+                        pass #Another OSA failed or was aborted, this one sweeps anyway
+                    finally:
+                        self.start_barrier = None
+            except BaseException:
+                if start_barrier is not None:
+                    start_barrier.abort() #Do not keep the other OSAs waiting for this one
+                raise
+            if self.aborts != token: #Aborted while the parameters were being sent, there is nothing to read
+                raise SweepAborted()
+            sweep_start = time.perf_counter()
+            try:
+                self.single_sweep(token)
+            except SweepAborted as aborted:
+                if partial_on_abort:
+                    aborted.partial = self.read_trace(trace)
+                raise
+            transfer_start = time.perf_counter()
+            spectrum = self.read_trace(trace)
+            sampling.record_sweep_time(self.sensitivity, len(spectrum['power'].magnitude),
+                                       transfer_start - sweep_start, time.perf_counter() - transfer_start, self.sweep_timing)
+            return spectrum
+
+    def abort_sweep(self):
+        """Stops the sweep in progress, can be called from any thread. The sweeping thread sends STP
+        to the OSA within poll_interval and get_trace raises SweepAborted, the settings stay as they were sent.
+        The sweeps requested before and still waiting for the bus are aborted too"""
+        with self._abort_lock:
+            self.aborts += 1
+        self.sweep_abort.set()
+        start_barrier = self.start_barrier
+        if start_barrier is not None:
+            start_barrier.abort() #Wakes up the sweep waiting for the other OSAs
+
+    def record_latency(self, setting, elapsed):
+        """Updates the running average of the time it takes to change a setting"""
+        self.setting_latency[setting] = (1 - latency_smoothing) * self.setting_latency[setting] + latency_smoothing * elapsed
+
+    def configure(self, updated_params):
+        """Sends the parameters in updated_params to the OSA without sweeping, returns the active trace"""
+        if 'trace' in updated_params:
+            trace = updated_params['trace']
+        else:
+            trace = 'A'  # Default value if 'trace' is not in the dictionary
+        #Trace has to be A,B or C
+        assert trace in ('A','B','C')
+        set_time = time.perf_counter()
+        self.active_trace(trace)
+        self.record_latency('trace', time.perf_counter() - set_time)
+
+        if 'start' in updated_params and 'stop' in updated_params:
+            start = to_magnitude(updated_params['start'], ureg.nm)
+            print(f'Converted start: {start}, type: {type(start)}')
+            set_time = time.perf_counter()
+            self.set_start(start)
+            self.record_latency('start', time.perf_counter() - set_time)
+
+        if 'stop' in updated_params:
+            stop = to_magnitude(updated_params['stop'], ureg.nm)
+            set_time = time.perf_counter()
+            self.set_stop(stop)
+            self.record_latency('stop', time.perf_counter() - set_time)
+
+        if 'ref_level' in updated_params:
+            ref = to_magnitude(updated_params['ref_level'], ureg.dBm)
+            set_time = time.perf_counter()
+            self.set_ref(ref)
+            self.record_latency('ref_level', time.perf_counter() - set_time)
+
+        if 'resolution' in updated_params:
+            resolution = to_magnitude(updated_params['resolution'], ureg.nm)
+            set_time = time.perf_counter()
+            self.set_resolution(resolution)
+            self.record_latency('resolution', time.perf_counter() - set_time)
+
+        if 'sensitivity' in updated_params:
+            set_time = time.perf_counter()
+            self.sensitivity_mode(updated_params['sensitivity'])
+            self.record_latency('sensitivity', time.perf_counter() - set_time)
+
+        if 'trace_points' in updated_params:
+            set_time = time.perf_counter()
+            self.set_trace_points(updated_params['trace_points'])
+            self.record_latency('trace_points', time.perf_counter() - set_time)
+        return trace
+
+    def single_sweep(self, token=None):
+        """Performs a single sweep and waits until it is finished. Raises SweepAborted if abort_sweep() is called meanwhile,
+        or since token was taken"""
+        if token is None:
+            token = self.sweep_token()
+        self.instrument().query('SGL')
+        #Ensure that the sweep is finished
+        sweep_status = self.instrument().query('SWEEP?').strip()
         print(f'Ongoing sweep, code: {sweep_status}')
-    #Get the wavelength data
-    wl_read = ANDO.query('WDAT'+trace).strip().split(',')
-    wl = wl_read[1:]
+        while sweep_status != '0':
+            #Wait for the next poll, waking up as soon as an abort is requested
+            self.sweep_abort.wait(poll_interval)
+            if self.aborts != token:
+                self.instrument().query('STP')
+                self.sweep_abort.clear()
+                print('Sweep aborted')
+                raise SweepAborted()
+            previous_status, sweep_status = sweep_status, self.instrument().query('SWEEP?').strip()
+            if sweep_status != previous_status:
+                print(f'Ongoing sweep, code: {sweep_status}')
+
+    def read_trace(self, trace='A'):
+        """Reads the wavelength and power data of trace from the OSA"""
+        #Get the wavelength data
+        wl = parse_data(self.instrument().query('WDAT'+trace))
+        #Get the power data
+        power = parse_data(self.instrument().query('LDAT'+trace))
+        spectrum_data = {
+            'wavelength': Q_(wl,  ureg.nm),
+            'power': Q_(power , ureg.dBm),
+        }
+        return spectrum_data
+
+    def set_start(self, start):
+        assert start>=600 and start<=1750
+        self.instrument().query(f'STAWL{start:.2f}')
+        rec_start = self.instrument().query('STAWL?')
+        assert float(rec_start.strip()) == start, f'Start wavelength not set correctly, expected {start}, got {rec_start}'
+
+    def set_stop(self, stop):
+        assert stop>=600 and stop<=1750
+        self.instrument().query(f'STPWL{stop:.2f}')
+        rec_stop = self.instrument().query('STPWL?')
+        assert float(rec_stop.strip()) == stop, f'Stop wavelength not set correctly, expected {stop}, got {rec_stop}'
+
+    def set_ref(self, ref_level):
+        assert ref_level>=-90 and ref_level<=20
+        self.instrument().query(f'REFL{ref_level:.1f}')
+        rec_ref = self.instrument().query('REFL?')
+        assert float(rec_ref.strip()) == ref_level, f'Reference level not set correctly, expected {ref_level}, got {rec_ref}'
+
+    def set_resolution(self, resolution):
+        assert resolution>=0.01 and resolution<=2.0
+        self.instrument().query(f'RESLN{resolution:.2f}')
+        rec_res = self.instrument().query('RESLN?')
+        assert float(rec_res.strip()) == resolution, f'Resolution not set correctly, expected {resolution}, got {rec_res}'
+
+    def active_trace(self, trace):
+        assert trace in ('A','B','C')
+        self.instrument().query(f'ACTV{trace}')
+
+    def sensitivity_mode(self, mode):
+        assert mode in ('SNHD', 'SNAT', 'SHI1', 'SHI2', 'SHI3')
+        self.instrument().query(mode)
+        self.sensitivity = mode
+
+    def set_trace_points(self, trace_points):
+        assert trace_points>=11 and trace_points<=20001
+        self.instrument().query(f'SMPL{trace_points}')
+        rec_points = self.instrument().query('SMPL?')
+        assert int(rec_points.strip()) == trace_points, f'Trace points not set correctly, expected {trace_points}, got {rec_points}'
+
+
+def parse_data(response):
+    """Converts the answer of WDAT or LDAT (number of points followed by the values) to an array"""
+    data_read = response.strip().split(',')
     # list of strings -> numpy array (vector) of floats
-    wl = np.asarray(wl,'f').T
-    points_read_wl = wl_read[0].split(' ')[-1]
-    assert int(points_read_wl) == len(wl)
-    
-    #Get the power data
-    power_read = ANDO.query('LDAT'+trace).strip().split(',')
-    power = power_read[1:]
-    power = np.asarray(power,'f').T
-    points_read_power = power_read[0].split(' ')[-1]
-    assert int(points_read_power) == len(power)
-    spectrum_data = {
-        'wavelength': Q_(wl,  ureg.nm),
-        'power': Q_(power , ureg.dBm),
-    }
-    return spectrum_data
+    data = np.asarray(data_read[1:],'f').T
+    points_read = data_read[0].split(' ')[-1]
+    assert int(points_read) == len(data)
+    return data
+
+
+#Drivers by GPIB address, filled by get_instrument and connect, that can run in different threads
+instruments = {}
+instruments_lock = threading.Lock()
+default = OSA()
+#The bus lock, abort event and latencies of the default OSA, for the code that uses the module functions
+bus_lock = default.bus_lock
+sweep_abort = default.sweep_abort
+setting_latency = default.setting_latency
+
+
+def get_instrument(address=None, simulate=None):
+    """Driver of the OSA at address, created the first time. None is the default OSA"""
+    if address is None or address == default.address:
+        return default
+    with instruments_lock:
+        if address not in instruments:
+            instruments[address] = OSA(address, simulate)
+        return instruments[address]
+
+
+def __getattr__(name):
+    #osa_driver.ANDO is the connection of the default OSA
+    if name == 'ANDO':
+        return default.ANDO
+    raise AttributeError(f"module 'osa_driver' has no attribute '{name}'")
+
+
+def connect(resource=None, simulate=None):
+    return default.connect(resource, simulate)
+
+def instrument():
+    return default.instrument()
+
+def sweep_token():
+    return default.sweep_token()
+
+def get_trace(updated_params, partial_on_abort=False, token=None):
+    return default.get_trace(updated_params, partial_on_abort, token=token)
+
+def abort_sweep():
+    default.abort_sweep()
+
+def record_latency(setting, elapsed):
+    default.record_latency(setting, elapsed)
+
+def configure(updated_params):
+    return default.configure(updated_params)
+
+def single_sweep(token=None):
+    default.single_sweep(token)
+
+def read_trace(trace='A'):
+    return default.read_trace(trace)
 
 def set_start(start):
-    assert start>=600 and start<=1750
-    ANDO.query(f'STAWL{start:.2f}')
-    rec_start = ANDO.query('STAWL?')
-    assert float(rec_start.strip()) == start, f'Start wavelength not set correctly, expected {start}, got {rec_start}'
+    default.set_start(start)
 
 def set_stop(stop):
-    assert stop>=600 and stop<=1750
-    ANDO.query(f'STPWL{stop:.2f}')
-    rec_stop = ANDO.query('STPWL?')
-    assert float(rec_stop.strip()) == stop, f'Stop wavelength not set correctly, expected {stop}, got {rec_stop}'
-
+    default.set_stop(stop)
 
 def set_ref(ref_level):
-    assert ref_level>=-90 and ref_level<=20
-    ANDO.query(f'REFL{ref_level:.1f}')
-    rec_ref = ANDO.query('REFL?')
-    assert float(rec_ref.strip()) == ref_level, f'Reference level not set correctly, expected {ref_level}, got {rec_ref}'
+    default.set_ref(ref_level)
 
 def set_resolution(resolution):
-    assert resolution>=0.01 and resolution<=2.0
-    ANDO.query(f'RESLN{resolution:.2f}')
-    rec_res = ANDO.query('RESLN?')
-    assert float(rec_res.strip()) == resolution, f'Resolution not set correctly, expected {resolution}, got {rec_res}'
+    default.set_resolution(resolution)
 
 def active_trace(trace):
-    assert trace in ('A','B','C')
-    ANDO.query(f'ACTV{trace}')
+    default.active_trace(trace)
 
-
-def sensitivity_mode(sensitivity):
-    assert sensitivity in ('SNHD', 'SNAT', 'SHI1', 'SHI2', 'SHI3')
-    ANDO.query(sensitivity)
+def sensitivity_mode(mode):
+    default.sensitivity_mode(mode)
 
 def set_trace_points(trace_points):
-    assert trace_points>=11 and trace_points<=20001
-    ANDO.query(f'SMPL{trace_points}')
-    rec_points = ANDO.query('SMPL?')
-    assert int(rec_points.strip()) == trace_points, f'Trace points not set correctly, expected {trace_points}, got {rec_points}'
-
-
+    default.set_trace_points(trace_points)
@@ -0,0 +1,62 @@
+"""
+Message format shared by osa_server.py and osa_client.py: a 4 byte big endian length, a JSON header,
+and the raw bytes of the arrays listed in header['arrays'].
+"""
+
+import json
+import struct
+import numpy as np
+
+_length = struct.Struct('>I')
+#Largest header accepted, protects the server from a wrong length
+max_header_size = 1 << 20
+
+
+def parse_address(address):
+    """'host:port' for TCP or 'unix:/path/to/socket' for a Unix socket.
+    Returns (family, address) with family 'tcp' or 'unix'"""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or 'localhost', int(port))
+
+
+def send_message(sock, header, arrays=None):
+    """Sends header (a JSON serializable dictionary) followed by the arrays (dictionary name -> np.ndarray)"""
+    arrays = arrays or {}
+    header = dict(header)
+    payloads = []
+    header['arrays'] = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        header['arrays'].append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape)})
+        payloads.append(array.tobytes())
+    header_bytes = json.dumps(header).encode()
+    sock.sendall(b''.join([_length.pack(len(header_bytes)), header_bytes] + payloads))
+
+
+def recv_message(sock):
+    """Receives a message, returns (header, arrays). Raises ConnectionError if the other side closed"""
+    (size,) = _length.unpack(_recv_exactly(sock, _length.size))
+    if size > max_header_size:
+        raise ConnectionError(f'Header of {size} bytes is too big')
+    header = json.loads(_recv_exactly(sock, size))
+    arrays = {}
+    for description in header.pop('arrays', []):
+        dtype = np.dtype(description['dtype'])
+        shape = tuple(description['shape'])
+        data = _recv_exactly(sock, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize)
+        arrays[description['name']] = np.frombuffer(data, dtype=dtype).reshape(shape)
+    return header, arrays
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('Connection closed')
+        received += count
+    return bytes(buffer)
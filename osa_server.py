@@ -0,0 +1,255 @@
+"""
+Acquisition server: owns the OSA and shares it with several clients (osa_client.py) over a local socket.
+
+    python osa_server.py --address localhost:5025
+    python osa_server.py --simulate
+"""
+
+import argparse
+import os
+import queue
+import socketserver
+import threading
+import time
+import traceback
+
+import osa_driver
+import segmented_sweep
+from osa_protocol import parse_address, send_message, recv_message
+from sweep_scheduler import changed_params
+from units import ureg
+
+default_address = 'localhost:5025'
+#Traces kept for a subscriber that is not reading, older ones are dropped
+subscriber_queue_size = 16
+
+
+def to_arrays(spectrum):
+    return {
+        'wavelength': spectrum['wavelength'].to(ureg.nm).magnitude.astype('<f4'),
+        'power': spectrum['power'].to(ureg.dBm).magnitude.astype('<f4'),
+    }
+
+
+class AcquisitionService:
+    """Owns the driver. All the GPIB traffic goes through here, one command at a time"""
+
+    def __init__(self):
+        self.bus_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.params = {} #Parameters the clients asked for
+        self.unsent = set() #Keys of params that the OSA may not have (e.g. the span after a segmented sweep)
+        self.sweep_count = 0
+        self.latest = None
+        self.current = None #Sweep in progress, shared with the requests for the same configuration
+        self.subscribers = []
+
+    def sweep(self, params, partial_on_abort=False):
+        token = osa_driver.sweep_token() #An abort while this request waits for the bus stops it too
+        with self.state_lock:
+            target = {**self.params, **params}
+            current = self.current
+        if current is not None and current['params'] == target:
+            current['done'].wait()
+            if current['error'] is not None:
+                raise current['error']
+            return current['result']
+
+        with self.bus_lock:
+            current = {'params': target, 'done': threading.Event(), 'result': None, 'error': None}
+            with self.state_lock:
+                self.current = current
+            try:
+                current['result'] = self._sweep(target, partial_on_abort, token)
+            except Exception as error:
+                current['error'] = error
+                with self.state_lock:
+                    self.params = dict(target)
+                    if isinstance(error, osa_driver.SweepAborted) and target.get('trace_points', 0) <= segmented_sweep.max_trace_points:
+                        self.unsent = set() #The settings were sent before the sweep was stopped
+                    else:
+                        self.unsent = set(target) #Unknown state of the OSA, send everything next time
+                raise
+            finally:
+                with self.state_lock:
+                    self.current = None
+                current['done'].set()
+        self._publish(current['result'])
+        return current['result']
+
+    def _changes(self, target):
+        """Parameters of target to send to the OSA: the ones that changed and the ones it may not have"""
+        with self.state_lock:
+            known = {k: v for k, v in self.params.items() if k not in self.unsent}
+        return changed_params(known, target)
+
+    def _sweep(self, target, partial_on_abort=False, token=None):
+        """Runs in the bus lock"""
+        updated_params = self._changes(target)
+        sweep_start = time.monotonic()
+        if target.get('trace_points', 0) > segmented_sweep.max_trace_points:
+            spectrum = segmented_sweep.get_segmented_trace(target, updated_params, token=token)
+            #The OSA is left with the span of the last segment, it is sent again in the next sweep
+            unsent = {'start', 'stop', 'trace_points'}
+        else:
+            spectrum = osa_driver.get_trace(updated_params, partial_on_abort, token)
+            unsent = set()
+        with self.state_lock:
+            self.params = dict(target)
+            self.unsent = unsent
+            self.sweep_count += 1
+        header = {
+            'sweep_id': self.sweep_count,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'sweep_time_s': time.monotonic() - sweep_start,
+            'params': target,
+        }
+        return header, to_arrays(spectrum)
+
+    def abort(self):
+        osa_driver.abort_sweep()
+
+    def configure(self, params):
+        with self.bus_lock:
+            updated_params = self._changes(params)
+            if updated_params:
+                osa_driver.configure(updated_params)
+            with self.state_lock:
+                self.params.update(params)
+                self.unsent -= set(updated_params)
+
+    def status(self):
+        with self.state_lock:
+            return {'params': self.params, 'sweep_count': self.sweep_count,
+                    'sweeping': self.current is not None, 'subscribers': len(self.subscribers)}
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=subscriber_queue_size)
+        with self.state_lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.state_lock:
+            self.subscribers.remove(subscriber)
+
+    def _publish(self, result):
+        with self.state_lock:
+            self.latest = result
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(result)
+                    break
+                except queue.Full:
+                    #Slow subscriber, drop its oldest trace
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """Serves the requests of one client connection"""
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                request, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            command = request.get('cmd')
+            try:
+                if command == 'sweep':
+                    header, arrays = service.sweep(request.get('params', {}), request.get('partial_on_abort', False))
+                    send_message(self.request, {'ok': True, **header}, arrays)
+                elif command == 'abort':
+                    service.abort()
+                    send_message(self.request, {'ok': True})
+                elif command == 'configure':
+                    service.configure(request.get('params', {}))
+                    send_message(self.request, {'ok': True})
+                elif command == 'latest':
+                    if service.latest is None:
+                        send_message(self.request, {'ok': False, 'error': 'No sweeps yet'})
+                    else:
+                        header, arrays = service.latest
+                        send_message(self.request, {'ok': True, **header}, arrays)
+                elif command == 'status':
+                    send_message(self.request, {'ok': True, **service.status()})
+                elif command == 'subscribe':
+                    send_message(self.request, {'ok': True})
+                    self.stream(service)
+                    return
+                else:
+                    send_message(self.request, {'ok': False, 'error': f'Unknown command {command}'})
+            except (ConnectionError, OSError):
+                return
+            except osa_driver.SweepAborted as aborted:
+                arrays = to_arrays(aborted.partial) if aborted.partial is not None else None
+                send_message(self.request, {'ok': False, 'aborted': True, 'error': 'Sweep aborted'}, arrays)
+            except Exception as error:
+                traceback.print_exc()
+                try:
+                    send_message(self.request, {'ok': False, 'error': f'{type(error).__name__}: {error}'})
+                except OSError:
+                    return
+
+    def stream(self, service):
+        """Sends every new trace to the client until it disconnects"""
+        subscriber = service.subscribe()
+        try:
+            while True:
+                header, arrays = subscriber.get()
+                send_message(self.request, {'ok': True, **header}, arrays)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            service.unsubscribe(subscriber)
+
+
+class TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(address=default_address, service=None):
+    """Creates the server listening on address ('host:port' or 'unix:/path'), call serve_forever() to run it"""
+    family, sock_address = parse_address(address)
+    if family == 'unix':
+        if os.path.exists(sock_address):
+            os.remove(sock_address)
+        server = UnixServer(sock_address, RequestHandler)
+    else:
+        server = TCPServer(sock_address, RequestHandler)
+    server.service = service or AcquisitionService()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shares the OSA with several clients over a local socket')
+    parser.add_argument('--address', default=default_address, help="'host:port' or 'unix:/path/to/socket'")
+    parser.add_argument('--resource', default=osa_driver.resource_name, help='GPIB address of the OSA')
+    parser.add_argument('--simulate', action='store_true', help='Use a simulated OSA')
+    args = parser.parse_args(argv)
+
+    osa_driver.connect(args.resource, simulate=args.simulate or None)
+    server = make_server(args.address)
+    print(f'Serving the OSA on {args.address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Simulated ANDO AQ6315A, to test the programs without the instrument.
+Used by osa_driver.connect(simulate=True) or with the environment variable OSA_SIMULATE=1.
+"""
+
+import os
+import time
+import threading
+import numpy as np
+
+#Multiplies all the simulated delays, 0 makes everything instantaneous (environment variable OSA_SIM_TIME_SCALE)
+sweep_time_scale = float(os.environ.get('OSA_SIM_TIME_SCALE', 1.0))
+
+#Time in s per trace point of a sweep for each sensitivity mode
+time_per_point = {'SNHD': 2e-4, 'SNAT': 5e-4, 'SHI1': 2e-3, 'SHI2': 5e-3, 'SHI3': 1e-2}
+#Noise floor in dBm for each sensitivity mode
+noise_floor = {'SNHD': -60, 'SNAT': -70, 'SHI1': -80, 'SHI2': -85, 'SHI3': -90}
+#Time in s to change the settings that need a mechanical or electronic reconfiguration
+setting_delay = {'RESLN': 1.0, 'sensitivity': 2.0}
+
+
+class SimulatedOSA:
+    """Emulates the GPIB interface of the OSA with query(command)"""
+
+    def __init__(self):
+        self.timeout = 40000
+        self.lock = threading.Lock()
+        self.settings = {'STAWL': 1500.0, 'STPWL': 1600.0, 'REFL': -10.0, 'RESLN': 0.1, 'SMPL': 1001}
+        self.sensitivity = 'SNAT'
+        self.active = 'A'
+        self.sweep_start = None
+        self.sweep_duration = 0
+        self.stopped_fraction = None
+        self.traces = {}
+        self.rng = np.random.default_rng()
+
+    def close(self):
+        pass
+
+    def write(self, command):
+        self.query(command)
+
+    def query(self, command):
+        with self.lock:
+            return self._answer(command.strip()) + '\r\n'
+
+    def _answer(self, command):
+        for key in self.settings:
+            if command == key + '?':
+                value = self.settings[key]
+                return f'{value}' if key == 'SMPL' else f'{value:.2f}'
+            if command.startswith(key):
+                value = float(command[len(key):])
+                self.settings[key] = int(value) if key == 'SMPL' else value
+                time.sleep(setting_delay.get(key, 0.01) * sweep_time_scale)
+                return ''
+        if command in noise_floor:
+            self.sensitivity = command
+            time.sleep(setting_delay['sensitivity'] * sweep_time_scale)
+            return ''
+        if command.startswith('ACTV'):
+            self.active = command[4:]
+            return ''
+        if command == 'SGL':
+            self.sweep_start = time.monotonic()
+            self.sweep_duration = (0.5 + self.settings['SMPL'] * time_per_point[self.sensitivity]) * sweep_time_scale
+            self.stopped_fraction = None
+            self.traces[self.active] = self._spectrum()
+            return ''
+        if command == 'STP':
+            if self._sweeping():
+                self.stopped_fraction = (time.monotonic() - self.sweep_start) / self.sweep_duration
+            self.sweep_start = None
+            return ''
+        if command == 'SWEEP?':
+            return '1' if self._sweeping() else '0'
+        if command[:4] in ('WDAT', 'LDAT'):
+            wavelength, power = self.traces.get(command[4:], self._spectrum())
+            data = wavelength if command.startswith('WDAT') else self._swept_part(power)
+            decimals = 2 if command.startswith('WDAT') else 3
+            return f'{len(data)},' + ','.join(f'{value:.{decimals}f}' for value in data)
+        return ''
+
+    def _sweeping(self):
+        return self.sweep_start is not None and time.monotonic() - self.sweep_start < self.sweep_duration
+
+    def _swept_part(self, power):
+        """Points that were not reached before a STP are left at the bottom of the scale"""
+        if self.stopped_fraction is None:
+            return power
+        power = power.copy()
+        power[int(len(power) * self.stopped_fraction):] = -210.0
+        return power
+
+    def _spectrum(self):
+        start, stop = self.settings['STAWL'], self.settings['STPWL']
+        resolution = self.settings['RESLN']
+        wavelength = np.linspace(start, stop, self.settings['SMPL'])
+        #Laser line at 1550 nm seen through a gaussian filter with the width of the resolution
+        laser = 10**(-10 / 10) * np.exp(-4 * np.log(2) * (wavelength - 1550)**2 / resolution**2)
+        #ASE band around 1530 nm, the power in the resolution bandwidth scales with the resolution
+        ase = 10**(-50 / 10) * resolution / 0.1 * np.exp(-(wavelength - 1530)**2 / (2 * 15**2))
+        floor = 10**(noise_floor[self.sensitivity] / 10) * self.rng.exponential(1, wavelength.size)
+        power = 10 * np.log10(laser + ase + floor)
+        return wavelength, power
@@ -0,0 +1,82 @@
+"""
+Traces relative to a reference trace, as the difference in dB or the linear ratio.
+"""
+
+import numpy as np
+
+from resample import Resampler
+
+modes = ('absolute', 'difference', 'ratio')
+#Units of the normalized traces for each mode
+mode_units = {'absolute': 'dBm', 'difference': 'dB', 'ratio': ''}
+
+
+class ReferenceNormalizer:
+    """Normalizes traces, identified by a key, against the reference trace"""
+
+    def __init__(self, resampler=None):
+        self.resampler = resampler or Resampler()
+        self.mode = 'absolute'
+        self.reference_key = None
+        self.reference_wavelength = None
+        self.reference_power = None
+        self._linear = {} #key -> power in mW, kept while the trace exists
+        self._normalized = {} #(mode, key) -> normalized power, valid for the current reference
+
+    def active(self):
+        return self.mode != 'absolute' and self.reference_key is not None
+
+    def set_mode(self, mode):
+        assert mode in modes
+        self.mode = mode
+
+    def set_reference(self, key, wavelength, power):
+        """power in dBm. Passing key None removes the reference"""
+        self.reference_key = key
+        self.reference_wavelength = None if key is None else np.asarray(wavelength)
+        self.reference_power = None if key is None else np.asarray(power)
+        self._normalized.clear()
+
+    def drop_cache(self, key):
+        """Drops the cached values of a trace, they are computed again when it is shown"""
+        self._linear.pop(key, None)
+        for mode in modes:
+            self._normalized.pop((mode, key), None)
+
+    def forget(self, key):
+        """Drops the cached values of a deleted trace"""
+        self.drop_cache(key)
+        if key == self.reference_key:
+            self.set_reference(None, None, None)
+
+    def linear(self, key, power):
+        if key not in self._linear:
+            self._linear[key] = 10**(np.asarray(power, dtype=np.float64) / 10)
+        return self._linear[key]
+
+    def normalize(self, traces):
+        """traces is a list of (key, wavelength, power in dBm). Returns a list with the power to show for each one"""
+        if not self.active():
+            return [power for _, _, power in traces]
+        missing = [trace for trace in traces if (self.mode, trace[0]) not in self._normalized]
+        same_axis = [trace for trace in missing if self._same_axis(trace[1])]
+        other_axis = [trace for trace in missing if not self._same_axis(trace[1])]
+        if same_axis:
+            #All the traces on the axis of the reference in one operation
+            if self.mode == 'difference':
+                block = np.stack([power for _, _, power in same_axis]) - self.reference_power
+            else:
+                block = np.stack([self.linear(key, power) for key, _, power in same_axis]) / self.linear(self.reference_key, self.reference_power)
+            for (key, _, _), row in zip(same_axis, block):
+                self._normalized[(self.mode, key)] = row
+        for key, wavelength, power in other_axis:
+            #Reference interpolated on the axis of the trace
+            reference = self.resampler.resample(self.reference_power, self.reference_wavelength, wavelength)
+            if self.mode == 'difference':
+                self._normalized[(self.mode, key)] = power - reference
+            else:
+                self._normalized[(self.mode, key)] = self.linear(key, power) / 10**(reference / 10)
+        return [self._normalized[(self.mode, key)] for key, _, _ in traces]
+
+    def _same_axis(self, wavelength):
+        return wavelength.shape == self.reference_wavelength.shape and np.array_equal(wavelength, self.reference_wavelength)
@@ -0,0 +1,70 @@
+"""
+Linear resampling of traces onto another wavelength axis, with cached index/weight tables.
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+def axis_key(axis):
+    """Identifies an axis by its length, ends and contents"""
+    return (len(axis), float(axis[0]), float(axis[-1]), hash(axis.tobytes()))
+
+
+def common_axis(axes):
+    """Axis covering all the axes with the finest step among them"""
+    start = min(float(axis[0]) for axis in axes)
+    stop = max(float(axis[-1]) for axis in axes)
+    step = min((float(axis[-1]) - float(axis[0])) / (len(axis) - 1) for axis in axes if len(axis) > 1)
+    return np.linspace(start, stop, int(round((stop - start) / step)) + 1)
+
+
+class Resampler:
+    """Linear interpolation between wavelength axes, with cached index/weight tables"""
+
+    def __init__(self, max_tables=64):
+        self.max_tables = max_tables
+        self._tables = OrderedDict() #(source key, target key) -> (index, weight, outside)
+
+    def table(self, source, target):
+        """Index of the source point below each target point, weight of the point above it,
+        and mask of the target points outside the source axis"""
+        key = (axis_key(source), axis_key(target))
+        if key in self._tables:
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        index = np.clip(np.searchsorted(source, target, side='right') - 1, 0, len(source) - 2)
+        weight = (target - source[index]) / (source[index + 1] - source[index])
+        outside = (target < source[0]) | (target > source[-1])
+        self._tables[key] = (index, weight, outside)
+        if len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+        return self._tables[key]
+
+    def resample(self, power, source, target):
+        """power (one trace, or a 2D block of traces on the same axis) from source to target axis"""
+        source = np.asarray(source, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        power = np.asarray(power, dtype=np.float64)
+        if source.shape == target.shape and np.array_equal(source, target):
+            return power
+        if len(source) < 2:
+            return np.full(power.shape[:-1] + target.shape, np.nan)
+        index, weight, outside = self.table(source, target)
+        result = power[..., index] * (1 - weight) + power[..., index + 1] * weight
+        result[..., outside] = np.nan
+        return result
+
+    def resample_many(self, traces, target):
+        """traces is a list of (wavelength, power). Traces on the same axis are resampled as one block.
+        Returns a list with the power of each trace on the target axis"""
+        groups = {}
+        for i, (wavelength, _) in enumerate(traces):
+            groups.setdefault(axis_key(np.asarray(wavelength, dtype=np.float64)), []).append(i)
+        result = [None] * len(traces)
+        for members in groups.values():
+            source = traces[members[0]][0]
+            block = self.resample(np.stack([traces[i][1] for i in members]), source, target)
+            for i, row in zip(members, block):
+                result[i] = row
+        return result
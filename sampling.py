@@ -0,0 +1,55 @@
+"""
+Choice of the trace points from the resolution, and prediction of the sweep time.
+"""
+
+import math
+
+samples_per_resolution = 4 #Trace points in each resolution bandwidth in auto mode
+min_trace_points = 11
+max_trace_points = 20001
+
+sweep_timing = {
+    'overhead': 0.5, #s per sweep, independent of the points
+    'per_point': {'SNHD': 2e-4, 'SNAT': 5e-4, 'SHI1': 2e-3, 'SHI2': 5e-3, 'SHI3': 1e-2}, #s per point in each sensitivity mode
+    'transfer_per_point': 2e-4, #s to read the wavelength and power of a point
+}
+timing_smoothing = 0.3 #Weight of the newest measurement in the running average
+
+
+def initial_timing():
+    """New sweep time model with the estimates of sweep_timing"""
+    return {**sweep_timing, 'per_point': dict(sweep_timing['per_point'])}
+
+
+def auto_trace_points(start, stop, resolution, samples=None):
+    """Fewest trace points with samples points per resolution bandwidth over start-stop (nm)"""
+    samples = samples or samples_per_resolution
+    points = math.ceil(round((stop - start) * samples / resolution, 6)) + 1
+    return min(max(points, min_trace_points), max_trace_points)
+
+
+def undersampled(start, stop, resolution, trace_points, samples=None):
+    """True if trace_points give less than samples points per resolution bandwidth"""
+    samples = samples or samples_per_resolution
+    return (trace_points - 1) * resolution < (stop - start) * samples - 1e-9
+
+
+def predict_times(trace_points, sensitivity, timing=None):
+    """Predicted (sweep, transfer) time in s with the model timing (the one of an OSA, sweep_timing by default).
+    Spans with more points than the OSA takes are swept in segments"""
+    timing = timing or sweep_timing
+    segments = max(1, math.ceil((trace_points - 1) / (max_trace_points - 1)))
+    per_point = timing['per_point'].get(sensitivity, max(timing['per_point'].values()))
+    sweep = segments * timing['overhead'] + trace_points * per_point
+    transfer = trace_points * timing['transfer_per_point']
+    return sweep, transfer
+
+
+def record_sweep_time(sensitivity, trace_points, sweep_time, transfer_time, timing):
+    """Updates the time model timing with a completed sweep of trace_points"""
+    if trace_points <= 0:
+        return
+    if sensitivity in timing['per_point']:
+        per_point = max(sweep_time - timing['overhead'], 0) / trace_points
+        timing['per_point'][sensitivity] += timing_smoothing * (per_point - timing['per_point'][sensitivity])
+    timing['transfer_per_point'] += timing_smoothing * (transfer_time / trace_points - timing['transfer_per_point'])
@@ -0,0 +1,119 @@
+"""
+Segmented sweeps for spans that need more than the 20001 points the OSA takes in a single sweep.
+"""
+
+import math
+import numpy as np
+
+import osa_driver
+from units import ureg, Q_, to_magnitude
+
+max_trace_points = 20001
+#Points shared by consecutive segments, to stitch them without gaps
+overlap_points = 10
+
+
+def plan_segments(start, stop, trace_points, max_points=max_trace_points):
+    """Splits start-stop (nm) sampled with trace_points into segments of at most max_points.
+    Returns a list of (start, stop, trace_points), in ascending order.
+    The OSA takes the wavelengths with 0.01 nm precision, so the segments start and stop at points of
+    the trace that are a multiple of 0.01 nm away from start, and every segment samples the same points
+    as the full trace. If there are no such points close enough, the segments are rounded to 0.01 nm
+    and get_segmented_trace interpolates the stitched trace to the requested points"""
+    if trace_points <= max_points:
+        return [(start, stop, trace_points)]
+    steps = trace_points - 1
+    step = (stop - start) / steps
+    #Steps between points of the trace at multiples of 0.01 nm
+    grid_steps = steps // math.gcd(round((stop - start) * 100), steps)
+    if grid_steps <= max_points - 1:
+        segment_steps = (max_points - 1) // grid_steps * grid_steps
+        #Steps advanced by each segment, the last overlap_points of a segment are swept again by the next one
+        advance = (max_points - 1 - overlap_points) // grid_steps * grid_steps or segment_steps
+        segments = []
+        first = 0
+        while True:
+            last = min(first + segment_steps, steps)
+            segments.append((round(start + first * step, 2), round(start + last * step, 2), last - first + 1))
+            if last == steps:
+                return segments
+            first += advance
+    segment_steps = max_points - 1 - overlap_points
+    n_segments = math.ceil((trace_points - 1 - overlap_points) / segment_steps)
+    segments = []
+    for i in range(n_segments):
+        seg_start = round(start + i * segment_steps * step, 2)
+        seg_stop = round(min(start + (i * segment_steps + max_points - 1) * step, stop), 2)
+        seg_points = min(int(round((seg_stop - seg_start) / step)) + 1, max_points)
+        segments.append((seg_start, seg_stop, seg_points))
+    return segments
+
+
+def segment_overlaps(segments, start, stop, trace_points):
+    """Points that each segment shares with the previous one, or None if the segments do not
+    sample the points of the trace (see plan_segments)"""
+    step = (stop - start) / (trace_points - 1)
+    bounds = []
+    for seg_start, seg_stop, seg_points in segments:
+        first, last = (seg_start - start) / step, (seg_stop - start) / step
+        if abs(first - round(first)) > 1e-6 or abs(last - round(last)) > 1e-6 or round(last) - round(first) + 1 != seg_points:
+            return None
+        bounds.append((round(first), round(last)))
+    return [previous[1] - following[0] + 1 for previous, following in zip(bounds, bounds[1:])]
+
+
+def stitch(segments, overlaps=None):
+    """Joins the (wavelength, power) arrays of consecutive segments in a single trace.
+    overlaps are the points each segment shares with the previous one (segment_overlaps): the points of
+    the lower segment are kept up to the middle of the overlap, and those of the upper segment from there on.
+    Without overlaps the cut is at the middle of the wavelengths they share, so the axis stays strictly increasing"""
+    wavelength, power = segments[0]
+    for i, (next_wavelength, next_power) in enumerate(segments[1:]):
+        if overlaps is not None:
+            lower = overlaps[i] // 2
+            keep = slice(0, len(wavelength) - overlaps[i] + lower)
+            keep_next = slice(lower, None)
+        else:
+            cut = (next_wavelength[0] + wavelength[-1]) / 2
+            keep = wavelength < cut
+            keep_next = next_wavelength >= cut
+        wavelength = np.concatenate((wavelength[keep], next_wavelength[keep_next]))
+        power = np.concatenate((power[keep], next_power[keep_next]))
+    return wavelength, power
+
+
+def get_segmented_trace(params, updated_params=None, max_points=max_trace_points, osa=None, token=None):
+    """Acquires the span of params (start, stop and trace_points) in segments and returns the stitched spectrum.
+    updated_params are the other parameters that changed since the last sweep, they are sent with the first segment.
+    After this the span of the OSA is the one of the last segment, so the next sweep has to send it again.
+    osa is the osa_driver.OSA to use, the default one if None. token is the one of osa.get_trace, an abort
+    stops the segment in progress and the ones after it"""
+    updated_params = updated_params or {}
+    osa = osa or osa_driver.default
+    if token is None:
+        token = osa.sweep_token()
+    start = to_magnitude(params['start'], ureg.nm)
+    stop = to_magnitude(params['stop'], ureg.nm)
+    segments = plan_segments(start, stop, params['trace_points'], max_points)
+    data = []
+    for i, (seg_start, seg_stop, seg_points) in enumerate(segments):
+        print(f'Segment {i + 1}/{len(segments)}: {seg_start}-{seg_stop} nm, {seg_points} points')
+        segment_params = {k: v for k, v in updated_params.items() if k not in ('start', 'stop', 'trace_points')} if i == 0 else {}
+        segment_params.update(start=seg_start, stop=seg_stop, trace_points=seg_points)
+        if 'trace' in params:
+            segment_params['trace'] = params['trace']
+        spectrum = osa.get_trace(segment_params, token=token)
+        data.append((spectrum['wavelength'].to(ureg.nm).magnitude,
+                     spectrum['power'].to(ureg.dBm).magnitude))
+    overlaps = segment_overlaps(segments, start, stop, params['trace_points'])
+    wavelength, power = stitch(data, overlaps)
+    if overlaps is None:
+        #The segments were rounded to 0.01 nm, interpolate to the requested points
+        requested = np.linspace(start, stop, params['trace_points'])
+        power = np.interp(requested, wavelength, power)
+        wavelength = requested
+    assert len(wavelength) == params['trace_points'], f'Stitched {len(wavelength)} points, expected {params["trace_points"]}'
+    return {
+        'wavelength': Q_(wavelength, ureg.nm),
+        'power': Q_(power, ureg.dBm),
+    }
@@ -0,0 +1,61 @@
+"""
+Conversion of the spectrum dictionaries returned by osa_driver into xarray objects,
+shared by the GUI and the headless scripts.
+"""
+
+import datetime
+import numpy as np
+
+
+def to_dataarray(spectrum: dict, name: str, attrs: dict = None) -> 'xr.DataArray':
+    """Builds a DataArray from a spectrum dictionary {'wavelength': Q_, 'power': Q_}.
+    attrs is an optional dictionary of extra attributes (e.g. the sweep parameters)"""
+    import xarray as xr
+    wavelength = spectrum['wavelength']
+    power = spectrum['power']
+    power_array = xr.DataArray(data = power.magnitude,
+                               coords = {'Wavelength': wavelength.magnitude},
+                               attrs = {'units': f'{power.units:~}'},
+                               name = name)
+    power_array['Wavelength'].attrs['units'] = f'{wavelength.units:~}'
+    if attrs:
+        power_array.attrs.update(params_to_attrs(attrs))
+    return power_array
+
+
+def to_common_axis(arrays: list, resampler) -> list:
+    """Resamples DataArrays with different wavelength axes onto a common one (see resample.py),
+    so that they can be merged in a Dataset. Arrays that already share the axis are returned as they are"""
+    import xarray as xr
+    from resample import common_axis
+    axes = [array['Wavelength'].values for array in arrays]
+    if all(axis.shape == axes[0].shape and np.array_equal(axis, axes[0]) for axis in axes):
+        return arrays
+    target = common_axis(axes)
+    powers = resampler.resample_many([(axis, array.values) for axis, array in zip(axes, arrays)], target)
+    resampled = []
+    for array, power in zip(arrays, powers):
+        new_array = xr.DataArray(data = power, coords = {'Wavelength': target}, attrs = array.attrs, name = array.name)
+        new_array['Wavelength'].attrs.update(array['Wavelength'].attrs)
+        resampled.append(new_array)
+    return resampled
+
+
+def params_to_attrs(params: dict) -> dict:
+    """Converts a dictionary of sweep parameters into NetCDF compatible attributes,
+    quantities are split in magnitude and units (key and key_units)"""
+    attrs = {}
+    for key, value in params.items():
+        if hasattr(value, 'units') and hasattr(value, 'magnitude'):
+            attrs[key] = value.magnitude
+            attrs[f'{key}_units'] = f'{value.units:~}'
+        elif isinstance(value, (int, float)):
+            attrs[key] = value
+        else:
+            attrs[key] = str(value)
+    return attrs
+
+
+def timestamp() -> str:
+    """Timestamp used in file names, same format as the autosave of the GUI"""
+    return datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
@@ -0,0 +1,126 @@
+"""
+Orders sweep configurations to change the slow settings of the OSA (resolution, sensitivity)
+as few times as possible, and runs them sending only the parameters that change.
+"""
+
+import itertools
+
+#Configurations up to this size are ordered exactly, bigger ones with a heuristic
+max_exact_size = 10
+
+
+def changed_params(previous, new):
+    """Returns only the parameters of new that differ from previous.
+    start and stop are always sent together, osa_driver.get_trace only sets start when both are present"""
+    changed = {k: v for k, v in new.items() if previous.get(k) != v}
+    if 'start' in changed or 'stop' in changed:
+        for key in ('start', 'stop'):
+            if key in new:
+                changed[key] = new[key]
+    return changed
+
+
+def change_cost(previous, new, latency):
+    """Estimated time in s to go from the configuration previous to new"""
+    return sum(latency.get(key, 0) for key in changed_params(previous, new))
+
+
+def plan_cost(configs, latency, initial=None):
+    """Estimated total reconfiguration time in s of running configs in that order"""
+    previous = initial or {}
+    cost = 0
+    for config in configs:
+        cost += change_cost(previous, config, latency)
+        previous = config
+    return cost
+
+
+def order_configurations(configs, latency, initial=None):
+    """Returns the order (list of indexes of configs) with the minimum estimated reconfiguration time.
+    initial is the configuration the OSA is in now, if it is known.
+    Small sets are solved exactly (Held-Karp), bigger ones with nearest neighbour and 2-opt"""
+    n = len(configs)
+    if n <= 1:
+        return list(range(n))
+    initial = initial or {}
+    #Cost matrix, cost[i][j] is the time to go from config i to config j
+    cost = [[change_cost(a, b, latency) for b in configs] for a in configs]
+    first_cost = [change_cost(initial, b, latency) for b in configs]
+    if n <= max_exact_size:
+        return _held_karp(cost, first_cost)
+    order = _nearest_neighbour(cost, first_cost)
+    return _two_opt(order, cost, first_cost)
+
+
+def _held_karp(cost, first_cost):
+    """Exact shortest open path visiting all the configurations, O(2^n n^2)"""
+    n = len(cost)
+    #best[(subset, last)] = (cost, previous) of the cheapest path visiting subset and ending in last
+    best = {(1 << i, i): (first_cost[i], None) for i in range(n)}
+    for size in range(2, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            bits = sum(1 << i for i in subset)
+            for last in subset:
+                rest = bits & ~(1 << last)
+                best[(bits, last)] = min((best[(rest, k)][0] + cost[k][last], k) for k in subset if k != last)
+    full = (1 << n) - 1
+    last = min(range(n), key=lambda i: best[(full, i)][0])
+    order = []
+    bits = full
+    while last is not None:
+        order.append(last)
+        bits, last = bits & ~(1 << last), best[(bits, last)][1]
+    return order[::-1]
+
+
+def _nearest_neighbour(cost, first_cost):
+    n = len(cost)
+    current = min(range(n), key=lambda i: first_cost[i])
+    order = [current]
+    remaining = set(range(n)) - {current}
+    while remaining:
+        current = min(remaining, key=lambda j: cost[current][j])
+        order.append(current)
+        remaining.remove(current)
+    return order
+
+
+def _two_opt(order, cost, first_cost):
+    """Reverses segments of the path while that makes it cheaper"""
+    def path_cost(path):
+        return first_cost[path[0]] + sum(cost[a][b] for a, b in zip(path, path[1:]))
+
+    best = path_cost(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 2, len(order) + 1):
+                candidate = order[:i] + order[i:j][::-1] + order[j:]
+                candidate_cost = path_cost(candidate)
+                if candidate_cost < best:
+                    order, best, improved = candidate, candidate_cost, True
+    return order
+
+
+def schedule(configs, latency=None, initial=None):
+    """Returns configs sorted to minimize the estimated reconfiguration time, and that time in s"""
+    if latency is None:
+        import osa_driver
+        latency = osa_driver.setting_latency
+    order = order_configurations(configs, latency, initial)
+    ordered = [configs[i] for i in order]
+    return ordered, plan_cost(ordered, latency, initial)
+
+
+def execute_plan(configs, initial=None):
+    """Sweeps every configuration in the scheduled order, sending only the changes between sweeps.
+    Yields (configuration, spectrum) for each sweep"""
+    import osa_driver
+    ordered, estimated = schedule(configs, osa_driver.setting_latency, initial)
+    print(f'Estimated reconfiguration time: {estimated:.1f} s')
+    previous = initial or {}
+    for config in ordered:
+        spectrum = osa_driver.get_trace(changed_params(previous, config))
+        previous = config
+        yield config, spectrum
@@ -0,0 +1,6 @@
+import os
+import sys
+
+#The modules are at the top of the repository, the simulated OSA answers right away
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OSA_SIM_TIME_SCALE', '0')
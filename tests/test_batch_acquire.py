@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import batch_acquire
+
+
+def write_plan(tmp_path, params, **plan):
+    path = tmp_path / 'plan.json'
+    path.write_text(json.dumps(dict(plan, output=str(tmp_path / 'out'), configurations=[{'name': 'c', 'params': params}])))
+    return str(path)
+
+
+@pytest.mark.parametrize('params', [
+    {'start': 1500, 'stop': 1900},
+    {'start': 1600, 'stop': 1500},
+    {'resolution': 5},
+    {'sensitivity': 'HIGH'},
+    {'trace_points': 5},
+    {'trace_points': 30001},
+    {'span': 10},
+])
+def test_invalid_params_are_refused(tmp_path, params):
+    with pytest.raises(AssertionError):
+        batch_acquire.load_plan(write_plan(tmp_path, params))
+
+
+def test_auto_trace_points(tmp_path):
+    plan = batch_acquire.load_plan(write_plan(tmp_path, {'start': 1500, 'stop': 1600, 'resolution': 0.1, 'trace_points': 'auto'}))
+    assert plan['configurations'][0]['params']['trace_points'] == 4001
+
+
+def test_only_io_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(batch_acquire, 'retry_delay', 0)
+    calls = []
+
+    def failing(error):
+        def get_trace(updated_params):
+            calls.append(updated_params)
+            if len(calls) == 1:
+                raise error
+            return 'spectrum'
+        return get_trace
+    assert batch_acquire.acquire({'start': 1500}, {}, failing(TimeoutError())) == 'spectrum'
+    assert len(calls) == 2
+    calls.clear()
+    with pytest.raises(AssertionError):
+        batch_acquire.acquire({'start': 1500}, {}, failing(AssertionError()))
+    assert len(calls) == 1
+
+
+def test_segmented_plan_with_simulator(tmp_path, monkeypatch):
+    monkeypatch.setenv('OSA_SIMULATE', '1')
+    import osa_driver
+    osa_driver.connect(simulate=True)
+    params = {'start': 1500, 'stop': 1600, 'resolution': 0.1, 'trace_points': 30001}
+    plan = batch_acquire.load_plan(write_plan(tmp_path, params, cycles=2))
+    stats = batch_acquire.run_plan(plan)
+    assert stats['sweeps'] == 2 and stats['failed'] == 0
+    assert stats['points'] == 2 * 30001
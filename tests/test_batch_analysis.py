@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import batch_analysis
+
+xr = pytest.importorskip('xarray')
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(3):
+        wavelength = np.linspace(1500, 1600, 101)
+        power = xr.DataArray(np.full(101, -50.0 + i), coords={'Wavelength': wavelength}, name='Trace 0',
+                             attrs={'resolution': 0.1, 'units': 'dBm'})
+        paths.append(str(tmp_path / f'sweep_{i}.nc'))
+        power.to_dataset().to_netcdf(paths[-1])
+    return paths
+
+
+def run(files, output, band):
+    analysis = lambda power_array: batch_analysis.spectral_metrics(power_array, band)
+    return batch_analysis.run(files, output, analysis, workers=1, settings={'analysis': 'spectral_metrics', 'band': band})
+
+
+def test_files_without_rows_are_not_analyzed_again(files, tmp_path):
+    output = str(tmp_path / 'results.csv')
+    #Outside the span of the traces, there are no results
+    assert run(files, output, [1700, 1750])['files'] == 3
+    stats = run(files, output, [1700, 1750])
+    assert stats['files'] == 0 and stats['skipped'] == 3
+
+
+def test_resume_with_other_settings_is_refused(files, tmp_path):
+    output = str(tmp_path / 'results.csv')
+    assert run(files[:2], output, [1520, 1550])['rows'] > 0
+    with pytest.raises(ValueError):
+        run(files, output, [1530, 1540])
+    stats = run(files, output, [1520, 1550])
+    assert stats['files'] == 1 and stats['skipped'] == 2
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PySide6.QtWidgets')
+pytest.importorskip('pyqtgraph')
+
+import main
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_window_in_offline_mode(app, monkeypatch):
+    #In offline mode main.py does not import the driver
+    monkeypatch.setattr(main, 'offline_mode', True)
+    monkeypatch.delattr(main, 'osa_driver', raising=False)
+    window = main.MainWindow()
+    assert window.instruments == ['Offline']
+    assert 'points' in window.predictionLabel.text()
+    window.close()
+
+
+def test_failed_sweep_sends_everything_next_time(app, monkeypatch):
+    monkeypatch.setattr(main, 'offline_mode', True)
+    window = main.MainWindow()
+    window.get_changed_params('Offline')
+    assert window.get_changed_params('Offline') == {}
+
+    class SweepAborted(Exception):
+        pass
+    window.sweepFailed((SweepAborted, SweepAborted(), ''), {'instrument': 'Offline'}, None)
+    assert window.get_changed_params('Offline') == window.params
+    window.close()
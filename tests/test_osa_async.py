@@ -0,0 +1,38 @@
+import asyncio
+
+import osa_driver
+import osa_sim
+from osa_async import AsyncOSA
+
+
+def test_own_resource_keeps_its_own_latency():
+    default_latency = dict(osa_driver.default.setting_latency)
+    osa = AsyncOSA(osa_sim.SimulatedOSA())
+    try:
+        spectrum = asyncio.run(osa.get_trace({'start': 1500, 'stop': 1600, 'sensitivity': 'SNHD', 'trace_points': 101}))
+    finally:
+        osa.close()
+    assert len(spectrum['power']) == 101
+    assert osa.setting_latency['sensitivity'] != osa_driver.initial_setting_latency['sensitivity']
+    assert osa_driver.default.setting_latency == default_latency
+
+
+def test_default_connection_waits_for_the_driver():
+    osa_driver.connect(simulate=True)
+    osa = AsyncOSA()
+
+    async def sweep_while_locked():
+        osa_driver.bus_lock.acquire()
+        task = asyncio.ensure_future(osa.get_trace({'trace_points': 101}))
+        await asyncio.sleep(0.2)
+        done = task.done()
+        osa_driver.bus_lock.release()
+        return done, await task
+    try:
+        done, spectrum = asyncio.run(sweep_while_locked())
+    finally:
+        osa.close()
+    assert not done and len(spectrum['power']) == 101
+    #The lock was released by the worker thread
+    assert osa_driver.bus_lock.acquire(timeout=1)
+    osa_driver.bus_lock.release()
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import osa_driver
+import osa_sim
+
+
+def test_abort_while_waiting_for_the_bus(monkeypatch):
+    monkeypatch.setattr(osa_sim, 'sweep_time_scale', 0.5)
+    osa = osa_driver.OSA(simulate=True)
+    results = {}
+
+    def sweep(name, token=None):
+        try:
+            results[name] = osa.get_trace({'trace_points': 20001}, token=token)
+        except osa_driver.SweepAborted:
+            results[name] = 'aborted'
+    first = threading.Thread(target=sweep, args=('first',))
+    first.start()
+    time.sleep(0.3)
+    queued = threading.Thread(target=sweep, args=('queued', osa.sweep_token()))
+    queued.start()
+    time.sleep(0.1)
+    osa.abort_sweep()
+    first.join(10)
+    queued.join(10)
+    assert results == {'first': 'aborted', 'queued': 'aborted'}
+
+
+def test_aborted_sweep_releases_the_other_osas():
+    first, second = osa_driver.OSA(simulate=True), osa_driver.OSA(simulate=True)
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def sweep(name, osa, token):
+        try:
+            results[name] = len(osa.get_trace({'trace_points': 101}, start_barrier=barrier, token=token)['power'])
+        except osa_driver.SweepAborted:
+            results[name] = 'aborted'
+    token = first.sweep_token()
+    first.abort_sweep() #Stop pressed while the sweep of the first OSA was queued
+    threads = [threading.Thread(target=sweep, args=('second', second, second.sweep_token()), daemon=True),
+               threading.Thread(target=sweep, args=('first', first, token), daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == {'first': 'aborted', 'second': 101}
+
+
+def test_abort_wakes_up_the_barrier():
+    osa = osa_driver.OSA(simulate=True)
+    barrier = threading.Barrier(2) #The other OSA never arrives
+    results = []
+
+    def sweep():
+        try:
+            osa.get_trace({'trace_points': 101}, start_barrier=barrier)
+        except osa_driver.SweepAborted:
+            results.append('aborted')
+    thread = threading.Thread(target=sweep, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+    osa.abort_sweep()
+    thread.join(10)
+    assert not thread.is_alive() and results == ['aborted']
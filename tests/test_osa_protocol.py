@@ -0,0 +1,30 @@
+import socket
+
+import numpy as np
+
+from osa_protocol import parse_address, recv_message, send_message
+
+
+def test_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        arrays = {'wavelength': np.linspace(1500, 1600, 20001), 'power': np.arange(12, dtype=np.float32).reshape(3, 4)}
+        send_message(left, {'cmd': 'sweep', 'params': {'start': 1500}}, arrays)
+        header, received = recv_message(right)
+    assert header == {'cmd': 'sweep', 'params': {'start': 1500}}
+    for name, array in arrays.items():
+        assert received[name].dtype == array.dtype
+        np.testing.assert_array_equal(received[name], array)
+
+
+def test_message_without_arrays():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {'ok': True})
+        assert recv_message(right) == ({'ok': True}, {})
+
+
+def test_parse_address():
+    assert parse_address('localhost:5025') == ('tcp', ('localhost', 5025))
+    assert parse_address(':5025') == ('tcp', ('localhost', 5025))
+    assert parse_address('unix:/tmp/osa.sock') == ('unix', '/tmp/osa.sock')
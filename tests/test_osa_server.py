@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+import osa_client
+import osa_driver
+import osa_server
+import osa_sim
+
+params = {'start': 1500, 'stop': 1600, 'resolution': 0.1, 'ref_level': -10, 'sensitivity': 'SNAT'}
+
+
+@pytest.fixture
+def client():
+    osa_driver.connect(simulate=True)
+    server = osa_server.make_server('localhost:0')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    with osa_client.OSAClient(f'{host}:{port}') as client:
+        yield client
+    server.shutdown()
+    server.server_close()
+
+
+def span(spectrum):
+    wavelength = spectrum['wavelength'].magnitude
+    return len(wavelength), wavelength[0], wavelength[-1]
+
+
+def test_sweep_and_status(client):
+    assert span(client.get_trace(dict(params, trace_points=1001))) == (1001, 1500, 1600)
+    status = client.status()
+    assert status['params']['trace_points'] == 1001
+    assert client.last_info['sweep_id'] == status['sweep_count']
+
+
+def test_omitted_params_keep_their_value(client):
+    client.get_trace(dict(params, trace_points=1001))
+    assert span(client.get_trace({'start': 1550})) == (1001, 1550, 1600)
+
+
+def test_span_after_segmented_sweep(client):
+    assert span(client.get_trace(dict(params, trace_points=30001))) == (30001, 1500, 1600)
+    #The OSA was left with the span of the last segment
+    assert span(client.get_trace({'trace_points': 1001})) == (1001, 1500, 1600)
+
+
+def test_abort(client, monkeypatch):
+    monkeypatch.setattr(osa_sim, 'sweep_time_scale', 0.5)
+    client.configure(dict(params, trace_points=20001))
+    errors = []
+
+    def sweep():
+        try:
+            client.get_trace()
+        except osa_client.SweepAborted as aborted:
+            errors.append(aborted)
+    thread = threading.Thread(target=sweep)
+    thread.start()
+    time.sleep(0.5)
+    client.abort_sweep()
+    thread.join(10)
+    assert not thread.is_alive() and len(errors) == 1
+
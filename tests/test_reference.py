@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from reference import ReferenceNormalizer
+
+axis = np.linspace(1500, 1600, 11)
+
+
+@pytest.fixture
+def normalizer():
+    normalizer = ReferenceNormalizer()
+    normalizer.set_reference('ref', axis, np.full(11, -20.0))
+    return normalizer
+
+
+def test_absolute_mode_returns_the_traces(normalizer):
+    power = np.full(11, -30.0)
+    assert normalizer.normalize([('a', axis, power)])[0] is power
+
+
+@pytest.mark.parametrize('mode, expected', [('difference', -10.0), ('ratio', 0.1)])
+def test_same_axis(normalizer, mode, expected):
+    normalizer.set_mode(mode)
+    traces = [('a', axis, np.full(11, -30.0)), ('b', axis, np.full(11, -20.0))]
+    a, b = normalizer.normalize(traces)
+    np.testing.assert_allclose(a, expected)
+    np.testing.assert_allclose(b, 0.0 if mode == 'difference' else 1.0)
+
+
+@pytest.mark.parametrize('mode, expected', [('difference', -10.0), ('ratio', 0.1)])
+def test_other_axis_is_resampled(normalizer, mode, expected):
+    normalizer.set_mode(mode)
+    #The reference changes linearly in dB, the trace is compared with it interpolated on its axis
+    normalizer.set_reference('ref', axis, np.linspace(-20, -10, 11))
+    other = np.linspace(1500, 1650, 31)
+    (result,) = normalizer.normalize([('a', other, np.interp(other, axis, np.linspace(-30, -20, 11)))])
+    inside = other <= 1600
+    np.testing.assert_allclose(result[inside], expected)
+    assert np.isnan(result[~inside]).all()
+
+
+def test_set_reference_clears_the_normalized_cache_only(normalizer):
+    normalizer.set_mode('ratio')
+    power = np.full(11, -30.0)
+    normalizer.normalize([('a', axis, power)])
+    linear = normalizer._linear['a']
+    normalizer.set_reference('ref2', axis, np.full(11, -40.0))
+    assert normalizer._normalized == {}
+    assert normalizer._linear['a'] is linear
+    np.testing.assert_allclose(normalizer.normalize([('a', axis, power)])[0], 10.0)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from resample import Resampler, common_axis
+
+
+def test_linear_function_is_exact():
+    source = np.linspace(1500, 1600, 101)
+    target = np.linspace(1510, 1590, 333)
+    power = 2 * source - 3000
+    np.testing.assert_allclose(Resampler().resample(power, source, target), 2 * target - 3000)
+
+
+def test_outside_the_source_is_nan():
+    source = np.linspace(1500, 1600, 11)
+    target = np.array([1490, 1500, 1550, 1600, 1610])
+    result = Resampler().resample(np.zeros(11), source, target)
+    assert np.isnan(result[[0, -1]]).all()
+    assert not np.isnan(result[1:-1]).any()
+
+
+def test_same_axis_is_not_resampled():
+    axis = np.linspace(1500, 1600, 11)
+    power = np.arange(11.0)
+    assert Resampler().resample(power, axis, axis.copy()) is power
+
+
+def test_tables_are_cached():
+    resampler = Resampler(max_tables=2)
+    source = np.linspace(1500, 1600, 11)
+    first = resampler.table(source, np.linspace(1500, 1600, 21))
+    assert resampler.table(source, np.linspace(1500, 1600, 21)) is first
+    resampler.table(source, np.linspace(1500, 1600, 31))
+    resampler.table(source, np.linspace(1500, 1600, 41))
+    assert len(resampler._tables) == 2
+
+
+def test_resample_many_keeps_the_order():
+    fine = np.linspace(1500, 1600, 101)
+    coarse = np.linspace(1500, 1600, 11)
+    traces = [(fine, fine - 1500), (coarse, coarse - 1500), (fine, 2 * (fine - 1500))]
+    target = common_axis([fine, coarse])
+    np.testing.assert_array_equal(target, fine)
+    result = Resampler().resample_many(traces, target)
+    np.testing.assert_allclose(result[0], fine - 1500)
+    np.testing.assert_allclose(result[1], fine - 1500)
+    np.testing.assert_allclose(result[2], 2 * (fine - 1500))
@@ -0,0 +1,21 @@
+import sampling
+
+
+def test_auto_trace_points():
+    #4 points per 0.1 nm over 100 nm
+    assert sampling.auto_trace_points(1500, 1600, 0.1) == 4001
+    assert sampling.auto_trace_points(1500, 1501, 2.0) == sampling.min_trace_points
+    assert sampling.auto_trace_points(600, 1750, 0.01) == sampling.max_trace_points
+
+
+def test_undersampled():
+    assert not sampling.undersampled(1500, 1600, 0.1, 4001)
+    assert sampling.undersampled(1500, 1600, 0.1, 4000)
+    assert sampling.undersampled(600, 1750, 0.01, sampling.max_trace_points)
+
+
+def test_segments_in_the_prediction():
+    timing = sampling.initial_timing()
+    single, _ = sampling.predict_times(20001, 'SNAT', timing)
+    double, _ = sampling.predict_times(20002, 'SNAT', timing)
+    assert double - single > timing['overhead']
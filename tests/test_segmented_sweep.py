@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import segmented_sweep
+
+
+def sweep_segments(start, stop, trace_points):
+    """Stitched trace of the plan, with the points the OSA would return for each segment"""
+    segments = segmented_sweep.plan_segments(start, stop, trace_points)
+    data = []
+    for seg_start, seg_stop, seg_points in segments:
+        wavelength = np.linspace(seg_start, seg_stop, seg_points)
+        data.append((wavelength, wavelength.copy()))
+    overlaps = segmented_sweep.segment_overlaps(segments, start, stop, trace_points)
+    return segments, overlaps, segmented_sweep.stitch(data, overlaps)
+
+
+def test_single_segment():
+    assert segmented_sweep.plan_segments(1500, 1600, 20001) == [(1500, 1600, 20001)]
+
+
+@pytest.mark.parametrize('start, stop, trace_points', [
+    (600, 1750, 1150001),
+    (600, 1750, 115001),
+    (1500, 1600, 40001),
+    (1500, 1600, 30001),
+])
+def test_segments_on_the_requested_points(start, stop, trace_points):
+    segments, overlaps, (wavelength, power) = sweep_segments(start, stop, trace_points)
+    for seg_start, seg_stop, seg_points in segments:
+        assert seg_points <= segmented_sweep.max_trace_points
+        #The OSA takes the wavelengths with 0.01 nm precision
+        assert seg_start == round(seg_start, 2) and seg_stop == round(seg_stop, 2)
+    assert segments[0][0] == start and segments[-1][1] == stop
+    assert overlaps is not None
+    assert len(wavelength) == trace_points
+    np.testing.assert_allclose(wavelength, np.linspace(start, stop, trace_points), rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(power, wavelength)
+
+
+def test_segments_off_the_requested_points():
+    #No point of the trace but the ends is a multiple of 0.01 nm from the start
+    segments, overlaps, (wavelength, _) = sweep_segments(1500, 1600, 20012)
+    assert overlaps is None
+    assert np.all(np.diff(wavelength) > 0)
+    assert wavelength[0] == 1500 and wavelength[-1] == 1600
+
+
+def test_segmented_trace_with_simulator():
+    import osa_driver
+    osa = osa_driver.OSA(simulate=True)
+    for trace_points in (30001, 20012):
+        spectrum = segmented_sweep.get_segmented_trace({'start': 1500, 'stop': 1600, 'trace_points': trace_points}, osa=osa)
+        wavelength = spectrum['wavelength'].magnitude
+        assert len(wavelength) == len(spectrum['power'].magnitude) == trace_points
+        assert wavelength[0] == 1500 and wavelength[-1] == 1600
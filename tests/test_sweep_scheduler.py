@@ -0,0 +1,41 @@
+import itertools
+
+from sweep_scheduler import changed_params, order_configurations, plan_cost
+
+latency = {'start': 0.5, 'stop': 0.5, 'resolution': 2.0, 'sensitivity': 3.0, 'trace_points': 0.5}
+
+
+def configs():
+    return [
+        {'start': 1500, 'stop': 1600, 'resolution': 1.0, 'sensitivity': 'SNAT'},
+        {'start': 1540, 'stop': 1560, 'resolution': 0.1, 'sensitivity': 'SHI1'},
+        {'start': 600, 'stop': 1750, 'resolution': 1.0, 'sensitivity': 'SNAT'},
+        {'start': 1545, 'stop': 1555, 'resolution': 0.1, 'sensitivity': 'SHI1'},
+        {'start': 1500, 'stop': 1600, 'resolution': 0.5, 'sensitivity': 'SNAT'},
+    ]
+
+
+def test_start_and_stop_are_sent_together():
+    previous = {'start': 1500, 'stop': 1600, 'resolution': 0.1}
+    assert changed_params(previous, {'start': 1500, 'stop': 1610, 'resolution': 0.1}) == {'start': 1500, 'stop': 1610}
+    assert changed_params(previous, dict(previous)) == {}
+
+
+def test_exact_order_is_optimal():
+    ordered = order_configurations(configs(), latency)
+    best = min(plan_cost([configs()[i] for i in order], latency) for order in itertools.permutations(range(5)))
+    assert sorted(ordered) == list(range(5))
+    assert plan_cost([configs()[i] for i in ordered], latency) == best
+
+
+def test_initial_configuration():
+    initial = configs()[3]
+    assert order_configurations(configs(), latency, initial)[0] in (1, 3)
+
+
+def test_heuristic_groups_slow_settings():
+    many = [dict(config, start=config['start'] + offset) for offset in range(3) for config in configs()]
+    ordered = [many[i] for i in order_configurations(many, latency)]
+    assert sorted(order_configurations(many, latency)) == list(range(len(many)))
+    changes = sum(a['sensitivity'] != b['sensitivity'] for a, b in zip(ordered, ordered[1:]))
+    assert changes == 1
@@ -0,0 +1,29 @@
+import numpy as np
+
+from trace_store import TraceStore
+
+
+def test_least_recently_viewed_are_spilled_until_under_budget():
+    store = TraceStore(budget=250)
+    for key in ('a', 'b', 'c', 'd'):
+        store.add(key, 100)
+    store.touch('a')
+    #400 bytes, 150 over: the two least recently viewed, b then c
+    assert store.to_spill(['a', 'b', 'c', 'd']) == ['b', 'c']
+    #Only candidates are spilled (e.g. the hidden traces)
+    assert store.to_spill(['a', 'd']) == ['d', 'a']
+
+
+def test_spill_and_load(tmp_path):
+    store = TraceStore(budget=0, directory=tmp_path)
+    wavelength = np.linspace(1500, 1600, 11, dtype=np.float32)
+    power = np.arange(11, dtype=np.float32)
+    store.add('a', 88)
+    store.spill('a', wavelength, power)
+    assert store.memory_use() == 0 and store.spilled == {'a'}
+    loaded_wavelength, loaded_power = store.load('a')
+    assert loaded_power.dtype == np.float32
+    np.testing.assert_array_equal(loaded_wavelength, wavelength)
+    np.testing.assert_array_equal(loaded_power, power)
+    store.remove('a')
+    assert not store.spilled
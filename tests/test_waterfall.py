@@ -0,0 +1,36 @@
+import numpy as np
+
+from waterfall import WaterfallBuffer
+
+
+def make_buffer(capacity=3, points=5):
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:, 0] = np.arange(256) #The red channel is the index in the table
+    return WaterfallBuffer(capacity, np.linspace(1500, 1600, points), lut, (-80, 0))
+
+
+def test_view_is_chronological_after_wrapping():
+    buffer = make_buffer()
+    for i in range(5):
+        buffer.push(np.full(5, -80 + 10 * i))
+    view = buffer.view()
+    assert view.shape[0] == 3
+    assert np.shares_memory(view, buffer.image)
+    #Oldest first: the sweeps at -60, -50 and -40 dBm
+    assert [row[0, 0] for row in view] == [int(10 * i * 255 / 80) for i in (2, 3, 4)]
+
+
+def test_sweep_by_index():
+    buffer = make_buffer()
+    for i in range(5):
+        buffer.push(np.full(5, float(i)))
+    assert buffer.first_index() == 2
+    assert buffer.sweep(1) is None
+    np.testing.assert_array_equal(buffer.sweep(4), np.full(5, 4.0))
+
+
+def test_accepts_only_the_same_axis():
+    buffer = make_buffer()
+    assert buffer.accepts(np.linspace(1500, 1600, 5))
+    assert not buffer.accepts(np.linspace(1500, 1600, 6))
+    assert not buffer.accepts(np.linspace(1500, 1610, 5))
@@ -0,0 +1,80 @@
+"""
+Memory budget of the traces of a session: the least recently viewed hidden traces are spilled to
+memory-mapped files when the budget is exceeded.
+"""
+
+import os
+import tempfile
+import itertools
+import numpy as np
+
+
+class TraceStore:
+    """Memory use of the traces, identified by a key, and their spill files"""
+
+    def __init__(self, budget, directory=None):
+        self.budget = budget #bytes
+        self.resident = {} #key -> bytes in memory
+        self.spilled = set()
+        self._last_viewed = {}
+        self._clock = itertools.count()
+        self._directory = directory
+        self._tempdir = None
+
+    def add(self, key, nbytes):
+        """Registers a trace in memory, viewed now"""
+        self.resident[key] = nbytes
+        self.spilled.discard(key)
+        self.touch(key)
+
+    def touch(self, key):
+        self._last_viewed[key] = next(self._clock)
+
+    def memory_use(self):
+        return sum(self.resident.values())
+
+    def over_budget(self):
+        return self.memory_use() > self.budget
+
+    def to_spill(self, candidates):
+        """Keys of the candidates to spill to get under the budget, least recently viewed first"""
+        excess = self.memory_use() - self.budget
+        selected = []
+        for key in sorted((key for key in candidates if key in self.resident), key=self._last_viewed.get):
+            if excess <= 0:
+                break
+            selected.append(key)
+            excess -= self.resident[key]
+        return selected
+
+    def spill(self, key, wavelength, power):
+        """Writes the arrays of the trace to its file, with their data type, the caller releases them afterwards"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            dtype = np.result_type(wavelength, power)
+            data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(2, len(wavelength)))
+            data[0] = wavelength
+            data[1] = power
+            data.flush()
+            del data
+        self.resident.pop(key, None)
+        self.spilled.add(key)
+
+    def load(self, key):
+        """Memory-mapped (wavelength, power) of a spilled trace, the pages are read as they are used"""
+        data = np.load(self._path(key), mmap_mode='r')
+        return data[0], data[1]
+
+    def remove(self, key):
+        """Forgets a deleted trace and removes its file"""
+        self.resident.pop(key, None)
+        self.spilled.discard(key)
+        self._last_viewed.pop(key, None)
+        if self._tempdir is not None and os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def _path(self, key):
+        if self._tempdir is None:
+            #Removed with its files when the store is garbage collected or the program exits
+            self._tempdir = tempfile.TemporaryDirectory(prefix='osa_traces_', dir=self._directory)
+        return os.path.join(self._tempdir.name, f'{key}.npy')
@@ -0,0 +1,40 @@
+"""
+Unit registry shared by the GUI, the driver and the scripts, built on first use.
+"""
+
+import threading
+
+_registry = None
+_lock = threading.Lock()
+
+
+def get_registry():
+    """Returns the shared UnitRegistry, building it the first time (from any thread)"""
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                from pint import UnitRegistry
+                _registry = UnitRegistry(autoconvert_offset_to_baseunit=True)
+    return _registry
+
+
+class _LazyRegistry:
+    """Stands for the registry until it is needed, ureg.nm builds it on first use"""
+
+    def __getattr__(self, name):
+        return getattr(get_registry(), name)
+
+
+ureg = _LazyRegistry()
+
+
+def Q_(*args, **kwargs):
+    return get_registry().Quantity(*args, **kwargs)
+
+
+def to_magnitude(value, unit):
+    """Magnitude of value in unit if it is a quantity, the value itself if it is a plain number"""
+    if hasattr(value, 'units') and hasattr(value, 'to'):
+        return value.to(unit).magnitude
+    return value
@@ -0,0 +1,59 @@
+"""
+Ring buffer of sweeps for the waterfall (spectrogram) view of the GUI.
+"""
+
+import numpy as np
+
+
+class WaterfallBuffer:
+    """Keeps the last capacity sweeps of points values each, and their colour mapped image"""
+
+    def __init__(self, capacity, wavelength, lut, levels):
+        """wavelength is the axis shared by all the sweeps, lut a (n, 4) uint8 colour table
+        and levels the (min, max) power in dBm mapped to the ends of the table"""
+        self.capacity = capacity
+        self.wavelength = np.asarray(wavelength)
+        self.lut = np.asarray(lut, dtype=np.uint8)
+        self.levels = levels
+        points = self.wavelength.size
+        self.power = np.empty((2 * capacity, points), dtype=np.float32)
+        self.image = np.zeros((2 * capacity, points, 4), dtype=np.uint8)
+        self.count = 0 #Sweeps added since the buffer was created
+
+    def accepts(self, wavelength):
+        """Whether a sweep with this wavelength axis can be added (otherwise a new buffer is needed)"""
+        return wavelength.shape == self.wavelength.shape and np.allclose(wavelength, self.wavelength)
+
+    def push(self, power):
+        """Adds a sweep, overwriting the oldest one if the buffer is full. O(points)"""
+        row = self.count % self.capacity
+        scale = (len(self.lut) - 1) / (self.levels[1] - self.levels[0])
+        indexes = np.clip((np.asarray(power) - self.levels[0]) * scale, 0, len(self.lut) - 1).astype(np.intp)
+        colours = self.lut[indexes]
+        for i in (row, row + self.capacity):
+            self.power[i] = power
+            self.image[i] = colours
+        self.count += 1
+
+    def _window(self):
+        """First row of the buffer and number of rows of the chronological slice"""
+        rows = min(self.count, self.capacity)
+        first = (self.count - rows) % self.capacity
+        return first, rows
+
+    def view(self):
+        """Image of the sweeps in the buffer, oldest first. A view, not a copy"""
+        first, rows = self._window()
+        return self.image[first:first + rows]
+
+    def first_index(self):
+        """Sweep index (since the buffer was created) of the oldest sweep in the buffer"""
+        return self.count - self._window()[1]
+
+    def sweep(self, index):
+        """Power of the sweep with that index, or None if it is no longer in the buffer"""
+        first, rows = self._window()
+        position = index - self.first_index()
+        if not 0 <= position < rows:
+            return None
+        return self.power[first + position].copy()